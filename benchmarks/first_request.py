@@ -0,0 +1,47 @@
+"""Run a script until it makes its first network request, then exit.
+
+    python benchmarks/first_request.py <result-file> <script> [args...]
+
+Name lookups are where every HTTP client we use (requests, httplib2)
+starts a request, so the first call to socket.getaddrinfo is caught and
+the process exits before anything is sent. What happened is written to
+<result-file> as JSON.
+"""
+import json
+import os
+import runpy
+import socket
+import sys
+import traceback
+
+
+def write_result(path, result):
+    with open(path, 'w') as f:
+        json.dump(result, f)
+
+def main():
+    result_path, script = sys.argv[1], sys.argv[2]
+
+    def first_request(host, port, *args, **kwargs):
+        write_result(result_path, {'reached': True, 'host': '{}:{}'.format(host, port)})
+        # Exit from whichever thread made the request, skipping atexit hooks.
+        sys.stdout.flush()
+        os._exit(0)
+    socket.getaddrinfo = first_request
+
+    # Run the script as if it were invoked directly.
+    sys.argv = sys.argv[2:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        error = None if e.code in (None, 0) else 'exited with {}'.format(e.code)
+    except BaseException:
+        error = traceback.format_exc(limit=-1).strip().splitlines()[-1]
+    else:
+        error = None
+
+    write_result(result_path, {'reached': False, 'error': error})
+
+if __name__ == '__main__':
+    main()
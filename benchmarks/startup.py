@@ -0,0 +1,231 @@
+"""Benchmark cold-start import time and time to first API request.
+
+Each command and script runs in a fresh interpreter, with dummy
+credentials, until it makes its first network request. Nothing is sent:
+see first_request.py.
+"""
+import click
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
+
+GSHEET_URL = 'https://docs.google.com/spreadsheets/d/benchmark-sheet/edit#gid=0'
+
+# Dummy settings, enough for each target to get as far as its first request.
+# Empty values override anything in a local .env, as load_dotenv won't.
+DUMMY_ENV = {
+    'DEBUG': '',
+    'SLACK_API_TOKEN': 'xoxb-benchmark',
+    'SLACK_ANNOUNCE_CHANNEL_PUB': 'C0BENCHMARK',
+    'SLACK_ANNOUNCE_CHANNEL_ORG': 'C0BENCHMARK',
+    'TRELLO_APP_KEY': 'benchmark',
+    'TRELLO_SECRET': 'benchmark',
+    'TRELLO_LIST_TONIGHT': 'benchmark-tonight',
+    'TRELLO_LIST_RECENT': 'benchmark-recent',
+    'TRELLO_CARD_IGNORE_LIST': '',
+    'TRELLO_SNAPSHOT': '',
+    'GH_PERSONAL_ACCESS_TOKEN': 'benchmark',
+    'MAILCHIMP_API_KEY': 'benchmark-us1',
+    'MAILCHIMP_API_USER': 'benchmark',
+    'MAILCHIMP_LIST_ID': 'benchmark',
+    'MAILCHIMP_TEMPLATE_ID': '1',
+    'MAILCHIMP_SECTION_NAME': 'benchmark',
+    'CTTO_CASSETTE': '',
+    'CTTO_METRICS_REPORT': '',
+}
+
+# Name, script and arguments for each target. {workdir} is filled in at run time.
+TARGETS = [
+    ('cli upload2gdrive', 'cli.py', ['upload2gdrive', '{workdir}/upload.txt',
+                                     '--gdrive-folder', 'benchmark', '--google-creds', '{workdir}/service-key.json']),
+    ('cli next-meetup', 'cli.py', ['next-meetup', '--meetup-api-key', 'benchmark', '--meetup-group-slug', 'benchmark']),
+    ('cli announce-booking-status', 'cli.py', ['announce-booking-status', '--gsheet', GSHEET_URL, '--channel', 'C0BENCHMARK']),
+    ('cli update-member-roster', 'cli.py', ['update-member-roster', '--gsheet', GSHEET_URL, '--channel', 'C0BENCHMARK']),
+    ('gsheet2shortlinks.py', 'gsheet2shortlinks.py', ['--gsheet', GSHEET_URL, '--rebrandly-api-key', 'benchmark']),
+    ('list_dm_partners.py', 'list_dm_partners.py', []),
+    ('move_trello_cards.py', 'move_trello_cards.py', ['--noop']),
+    ('notify_slack_pitches.py', 'notify_slack_pitches.py', []),
+    ('notify_slack_roles.py', 'notify_slack_roles.py', []),
+    ('send_monthly_project_email.py', 'send_monthly_project_email.py', []),
+    ('update_pitch_csv.py', 'update_pitch_csv.py', []),
+    ('scripts/gsheet2meetup.py', 'scripts/gsheet2meetup.py', ['--gsheet', GSHEET_URL,
+                                                              '--meetup-api-key', 'benchmark', '--meetup-group-slug', 'benchmark']),
+]
+
+# Lines of `python -X importtime` output: self and cumulative microseconds, then
+# the module name, indented by two spaces per level of nesting.
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def make_workdir():
+    """Create a working directory with the files scripts expect to find."""
+    workdir = tempfile.mkdtemp(prefix='ctto-benchmark-')
+    os.symlink(os.path.join(REPO_DIR, 'templates'), os.path.join(workdir, 'templates'))
+    with open(os.path.join(workdir, 'upload.txt'), 'w') as f:
+        f.write('benchmark\n')
+
+    # Credentials are signed before the token request, so the key must be real.
+    import rsa
+    _, private_key = rsa.newkeys(1024)
+    keyfile = {
+        'type': 'service_account',
+        'client_email': 'benchmark@example.iam.gserviceaccount.com',
+        'client_id': '1',
+        'private_key_id': 'benchmark',
+        'private_key': private_key.save_pkcs1().decode('ascii'),
+    }
+    with open(os.path.join(workdir, 'service-key.json'), 'w') as f:
+        json.dump(keyfile, f)
+    return workdir
+
+def run_target(script, args, workdir, importtime=False):
+    result_path = os.path.join(workdir, 'result.json')
+    if os.path.exists(result_path):
+        os.remove(result_path)
+
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += [os.path.join(BENCHMARK_DIR, 'first_request.py'), result_path, os.path.join(REPO_DIR, script)]
+    cmd += [a.format(workdir=workdir) for a in args]
+
+    env = dict(os.environ, CTTO_HTTP_CACHE_DIR=os.path.join(workdir, 'http-cache'), **DUMMY_ENV)
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=workdir, env=env, stdin=subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    try:
+        with open(result_path) as f:
+            result = json.load(f)
+    except (IOError, ValueError):
+        result = {'reached': False, 'error': 'exited with {}'.format(proc.returncode)}
+    result['seconds'] = elapsed
+    result['stderr'] = proc.stderr
+    return result
+
+def parse_importtime(stderr):
+    """Return total import seconds, and cumulative seconds per top-level import."""
+    modules = {}
+    for line in stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        # Only top-level imports, as nested ones are in their parent's total.
+        if m and len(m.group(3)) == 1:
+            name = m.group(4)
+            modules[name] = modules.get(name, 0) + int(m.group(2)) / 1e6
+    return sum(modules.values()), modules
+
+def benchmark_target(script, args, workdir, repeat):
+    runs = [run_target(script, args, workdir) for _ in range(repeat)]
+    profile = run_target(script, args, workdir, importtime=True)
+    import_seconds, modules = parse_importtime(profile['stderr'])
+    return {
+        'first_request_seconds': statistics.median(r['seconds'] for r in runs),
+        'import_seconds': import_seconds,
+        'reached': runs[-1]['reached'],
+        'host': runs[-1].get('host'),
+        'error': runs[-1].get('error'),
+        'modules': modules,
+    }
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['targets']
+    except IOError:
+        return {}
+
+def write_baseline(path, results):
+    # Module breakdowns are left out, to keep the file reviewable.
+    targets = {name: {k: v for k, v in r.items() if k != 'modules'} for name, r in results.items()}
+    data = {'python': sys.version.split()[0], 'targets': targets}
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def is_regression(current, baseline, tolerance, min_seconds):
+    # Ignore small absolute changes, which are mostly noise.
+    return current - baseline > max(baseline * tolerance, min_seconds)
+
+@click.command(context_settings=CONTEXT_SETTINGS)
+@click.option('--target', '-t', 'only',
+              multiple=True,
+              help='Only run targets whose name contains this. Can be repeated.',
+              metavar='<name>')
+@click.option('--repeat', '-n',
+              default=5,
+              help='Runs per target. The median is reported. Default: 5',
+              )
+@click.option('--top',
+              default=5,
+              help='Slowest top-level imports to list per target. Default: 5',
+              )
+@click.option('--baseline',
+              default=BASELINE_PATH,
+              type=click.Path(dir_okay=False),
+              help='Baseline file to compare against or save to.',
+              metavar='<file>')
+@click.option('--save-baseline',
+              is_flag=True,
+              help='Save these results as the new baseline.')
+@click.option('--tolerance',
+              default=0.2,
+              help='Allowed slowdown over baseline, as a fraction. Default: 0.2',
+              )
+@click.option('--min-seconds',
+              default=0.05,
+              help='Slowdowns smaller than this are never regressions. Default: 0.05',
+              )
+def startup(only, repeat, top, baseline, save_baseline, tolerance, min_seconds):
+    """Measure import time and time to first API request for each command."""
+    targets = [t for t in TARGETS if not only or any(o in t[0] for o in only)]
+    workdir = make_workdir()
+    baselines = load_baseline(baseline)
+
+    results = {}
+    regressions = []
+    try:
+        for name, script, args in targets:
+            result = benchmark_target(script, args, workdir, repeat)
+            results[name] = result
+
+            status = 'first request to {}'.format(result['host']) if result['reached'] else 'no request: {}'.format(result['error'])
+            click.echo('{}  ({})'.format(name, status))
+            for key, label in [('first_request_seconds', 'first request'), ('import_seconds', 'imports')]:
+                line = '    {:<14} {:6.3f}s'.format(label, result[key])
+                base = baselines.get(name, {}).get(key)
+                if base:
+                    line += '  (baseline {:.3f}s, {:+.0%})'.format(base, result[key] / base - 1)
+                    if is_regression(result[key], base, tolerance, min_seconds):
+                        line += '  REGRESSION'
+                        regressions.append((name, label))
+                click.echo(line)
+
+            slowest = sorted(result['modules'].items(), key=lambda m: m[1], reverse=True)[:top]
+            for module, seconds in slowest:
+                click.echo('      {:<30} {:6.3f}s'.format(module, seconds))
+    finally:
+        shutil.rmtree(workdir)
+
+    if save_baseline:
+        # Keep baselines for targets that weren't run this time.
+        write_baseline(baseline, dict(load_baseline(baseline), **results))
+        click.echo('Saved baseline to {}'.format(baseline))
+    elif regressions:
+        click.echo('{} regression(s) over baseline: {}'.format(
+            len(regressions), ', '.join('{} {}'.format(*r) for r in regressions)), err=True)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    startup()
@@ -1,19 +1,37 @@
 import click
-from commands.upload2gdrive import upload2gdrive
-from commands.next_meetup import next_meetup
-from commands.announce_booking_status import announce_booking_status
-from commands.update_member_roster import update_member_roster
+import importlib
 
 CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
 
-@click.group(context_settings=CONTEXT_SETTINGS)
+# Commands are imported only when invoked, so each run only pays for the
+# dependencies (gspread, pydrive, dateparser, etc.) of the command it runs.
+LAZY_COMMANDS = {
+    'upload2gdrive': 'commands.upload2gdrive:upload2gdrive',
+    'next-meetup': 'commands.next_meetup:next_meetup',
+    'announce-booking-status': 'commands.announce_booking_status:announce_booking_status',
+    'update-member-roster': 'commands.update_member_roster:update_member_roster',
+}
+
+class LazyGroup(click.Group):
+    """Group that imports subcommands from 'module:attr' paths on first use."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module_name, attr = self.lazy_commands[cmd_name].split(':')
+            module = importlib.import_module(module_name)
+            self.add_command(getattr(module, attr), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS, context_settings=CONTEXT_SETTINGS)
 def cli():
     pass
 
-cli.add_command(upload2gdrive)
-cli.add_command(next_meetup)
-cli.add_command(announce_booking_status)
-cli.add_command(update_member_roster)
-
 if __name__ == '__main__':
     cli()
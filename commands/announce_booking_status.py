@@ -1,20 +1,42 @@
 import click
-import dateparser
+import functools
 import pystache
-import requests
 
 from datetime import datetime
 
-from commands.common import common_params, parse_gdoc_url, InsensitiveDictReader
+from commands.common import common_params, InsensitiveDictReader
+from commands.utils.sheet_source import SheetFetchError, SheetSource
 from commands.utils.slackclient import CustomSlackClient
 
 CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
 
+# Date formats tried before falling back to dateparser: ISO, and the
+# formats Google Sheets displays dates in by default.
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%B %d, %Y', '%b %d, %Y', '%a, %B %d, %Y']
+
+@functools.lru_cache(maxsize=1024)
+def parse_date(value):
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+
+    # dateparser handles anything else, but is slow to import and to run.
+    import dateparser
+    return dateparser.parse(value)
+
 class Booking(object):
     status = str()
     date = None
 
 class BookingsProcessor(object):
+    """Venue and speaker booking statuses for the next EVENT_COUNT events.
+
+    One processor can be kept per sheet in a long-running process, and
+    updated with new content as the sheet changes.
+    """
     EMOJI_BOOKED = ':white_check_mark:'
     EMOJI_NOT_BOOKED = ':heavy_multiplication_x:'
     EMOJI_UNKNOWN = ':question:'
@@ -22,16 +44,32 @@ class BookingsProcessor(object):
 
     EVENT_COUNT = 11
 
-    csv_content = str()
-    venue_bookings = []
-    speaker_bookings = []
-    venue_string = str()
-    speaker_string = str()
-
-    def __init__(self, csv_content):
-        self.csv_content = csv_content
-        self._process_bookings()
+    def __init__(self, csv_content=None, version=None):
+        self.venue_bookings = []
+        self.speaker_bookings = []
+        self.venue_string = str()
+        self.speaker_string = str()
+        # What the current bookings were evaluated from, to skip repeats.
+        self._evaluated = None
+        if csv_content is not None:
+            self.update(csv_content, version=version)
+
+    def update(self, csv_content, version=None, now=None):
+        """Re-evaluate bookings from sheet content, returning whether it ran.
+
+        version identifies the content, eg. the export's ETag. If it's the
+        same as last time, on the same day, the content isn't read at all.
+        """
+        now = now or datetime.now()
+        # Which events are upcoming also changes at midnight.
+        evaluated = (version, now.date())
+        if version is not None and evaluated == self._evaluated:
+            return False
+
+        self.venue_bookings, self.speaker_bookings = self._process_bookings(csv_content, now)
         self._generate_emoji()
+        self._evaluated = evaluated
+        return True
 
     def _generate_emoji(self):
         lookup = {
@@ -53,16 +91,21 @@ class BookingsProcessor(object):
             emojis.append(e)
         self.speaker_string = "".join(emojis)
 
-    def _process_bookings(self):
+    def _process_bookings(self, csv_content, now):
+        venue_bookings = []
+        speaker_bookings = []
         # Iterate through CSV content and perform actions on data
-        reader = InsensitiveDictReader(self.csv_content, delimiter=',')
+        reader = InsensitiveDictReader(csv_content, delimiter=',')
         for row in reader:
+            # Only the first EVENT_COUNT upcoming events are shown.
+            if len(venue_bookings) >= self.EVENT_COUNT:
+                break
+
             if not row['date']:
                 continue
 
-            date = dateparser.parse(row['date'])
-            now = datetime.now()
-            if date < now:
+            date = parse_date(row['date'])
+            if date is None or date < now:
                 continue
 
             is_emptyish = lambda s: s.lower() in ['tba', 'tbd', '']
@@ -73,7 +116,7 @@ class BookingsProcessor(object):
                 venue_booking.status = 'unbooked'
             else:
                 venue_booking.status = 'booked'
-            self.venue_bookings.append(venue_booking)
+            venue_bookings.append(venue_booking)
 
             speaker_booking = Booking()
             speaker_booking.date = date
@@ -85,7 +128,9 @@ class BookingsProcessor(object):
                     speaker_booking.status = 'unknown'
             else:
                 speaker_booking.status = 'unbooked'
-            self.speaker_bookings.append(speaker_booking)
+            speaker_bookings.append(speaker_booking)
+
+        return venue_bookings, speaker_bookings
 
 @click.command(context_settings=CONTEXT_SETTINGS)
 @click.option('--gsheet',
@@ -121,18 +166,18 @@ def announce_booking_status(gsheet, channel, slack_token, yes, verbose, debug, n
     if noop:
         raise NotImplementedError
 
-    spreadsheet_key, worksheet_id = parse_gdoc_url(gsheet)
-    CSV_URL_TEMPLATE = 'https://docs.google.com/spreadsheets/d/{key}/export?format=csv&id={key}&gid={id}'
-    csv_url = CSV_URL_TEMPLATE.format(key=spreadsheet_key, id=worksheet_id)
-
-    # Fetch and parse CSV.
-    r = requests.get(csv_url)
-    if r.status_code != requests.codes.ok:
+    # Fetch and parse CSV, as it downloads.
+    sheet = SheetSource(gsheet)
+    try:
+        sheet.fetch()
+    except SheetFetchError:
         raise click.Abort()
-    csv_content = r.content.decode('utf-8')
-    csv_content = csv_content.split('\r\n')
+    spreadsheet_key, worksheet_id = sheet.key, sheet.worksheet_id
 
-    bookings = BookingsProcessor(csv_content)
+    bookings = BookingsProcessor(sheet.lines(), version=sheet.version)
+    # Parsing stops after EVENT_COUNT events, so finish the download and
+    # cache it now.
+    sheet.close()
 
     tmpl_vars = {
         'venue_statuses': bookings.venue_string,
@@ -2,6 +2,7 @@ import click
 import csv
 import functools
 import hashlib
+import os
 import re
 
 
@@ -21,9 +22,30 @@ def common_params(func):
     @click.option('--noop',
                   help='Skip API calls that change/destroy data',
                   is_flag=True)
+    @click.option('--cassette',
+                  help='Record API calls to this file, or replay them if it exists',
+                  envvar=prefix_envvar('CASSETTE'),
+                  metavar='<file>')
+    @click.option('--metrics-report',
+                  help='Write per-endpoint API call stats to this file (JSON, or Prometheus if .prom)',
+                  envvar=prefix_envvar('METRICS_REPORT'),
+                  metavar='<file>')
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        return func(*args, **kwargs)
+        cassette = kwargs.pop('cassette')
+        metrics_report = kwargs.pop('metrics_report')
+        if not cassette and not metrics_report:
+            return func(*args, **kwargs)
+
+        # Imported here so commands can still run standalone from this directory.
+        from commands.utils.cassette import use_cassette
+        from commands.utils.metrics import collect_metrics
+        mode = os.getenv(prefix_envvar('CASSETTE_MODE'))
+        latency = os.getenv(prefix_envvar('CASSETTE_LATENCY'))
+        # Metrics wrap the cassette, so replayed calls are measured too.
+        with use_cassette(cassette, mode=mode, latency=latency), \
+             collect_metrics(metrics_report, func.__name__):
+            return func(*args, **kwargs)
     return wrapper
 
 def prefix_envvar(str):
@@ -57,18 +79,95 @@ def parse_gdoc_url(url):
 
     return spreadsheet_key, worksheet_id
 
-class InsensitiveDictReader(csv.DictReader):
-    # This class overrides the csv.fieldnames property, which converts all fieldnames without leading and trailing spaces and to lower case.
+def normalize_fieldname(name):
+    return name.strip().lower()
+
+class InsensitiveRow(object):
+    """A CSV row whose fields are looked up ignoring case and surrounding spaces.
+
+    Rows from one reader share its header index, so each row only holds
+    its list of values.
+    """
+    __slots__ = ('_index', '_values', '_restval')
+
+    def __init__(self, index, values, restval=None):
+        self._index = index
+        self._values = values
+        self._restval = restval
+
+    def __getitem__(self, key):
+        i = self._index.get(key)
+        if i is None:
+            i = self._index[normalize_fieldname(key)]
+        # Short rows get restval for missing fields, as with csv.DictReader.
+        return self._values[i] if i < len(self._values) else self._restval
+
+    def __contains__(self, key):
+        return key in self._index or normalize_fieldname(key) in self._index
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [k for k, i in self._index.items() if k == normalize_fieldname(k)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __repr__(self):
+        return 'InsensitiveRow({!r})'.format(dict(self.items()))
+
+class InsensitiveDictReader(object):
+    """Like csv.DictReader, but fieldnames are stripped and lowercased.
+
+    The header is normalized once, into an index shared by every row, so
+    field lookups don't re-normalize names.
+    """
+
+    def __init__(self, f, fieldnames=None, restval=None, **kwargs):
+        self.reader = csv.reader(f, **kwargs)
+        self.restval = restval
+        self._fieldnames = None
+        self._index = None
+        if fieldnames is not None:
+            self._set_header(fieldnames)
+
+    def _set_header(self, header):
+        self._fieldnames = [normalize_fieldname(f) for f in header]
+        index = {}
+        for i, (raw, name) in enumerate(zip(header, self._fieldnames)):
+            index[name] = i
+            # Exact spellings from the sheet resolve without normalizing.
+            index[raw] = i
+        self._index = index
 
     @property
     def fieldnames(self):
-        return [field.strip().lower() for field in csv.DictReader.fieldnames.fget(self)]
+        if self._fieldnames is None:
+            self._set_header(next(self.reader, []))
+        return self._fieldnames
 
-    def next(self):
-        return InsensitiveDict(csv.DictReader.next(self))
+    @property
+    def line_num(self):
+        return self.reader.line_num
 
-class InsensitiveDict(dict):
-    # This class overrides the __getitem__ method to automatically strip() and lower() the input key
+    def __iter__(self):
+        return self
 
-    def __getitem__(self, key):
-        return dict.__getitem__(self, key.strip().lower())
+    def __next__(self):
+        if self._index is None:
+            self.fieldnames
+        row = next(self.reader)
+        # Skip blank rows, as csv.DictReader does.
+        while row == []:
+            row = next(self.reader)
+        return InsensitiveRow(self._index, row, self.restval)
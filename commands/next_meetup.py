@@ -4,9 +4,11 @@ import re
 
 try:
     import commands.common as common
+    from commands.utils.ratelimit import RateLimitedService, get_bucket
 except ImportError:
     # Allow running file as standalone
     import common
+    from utils.ratelimit import RateLimitedService, get_bucket
 
 CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
 
@@ -45,6 +47,8 @@ def next_meetup(meetup_api_key, meetup_group_slug, filter, fields, yes, verbose,
         filter = '.*'
 
     mclient = meetup.api.Client(meetup_api_key)
+    # Pace calls to our rate limit, and retry them if throttled.
+    mclient.session = RateLimitedService(get_bucket('meetup'), http=mclient.session)
     response = mclient.GetEvents({
         'group_urlname': meetup_group_slug,
         'status': 'upcoming',
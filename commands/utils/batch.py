@@ -0,0 +1,39 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from commands.utils.ratelimit import get_bucket
+
+
+DEFAULT_CONCURRENCY = 8
+
+def run_batch(func, items, service=None, concurrency=DEFAULT_CONCURRENCY):
+    """Call func on each item concurrently, returning results in item order.
+
+    The API clients we use are blocking, so calls run on a bounded thread
+    pool driven by an asyncio loop. If a service is given, each call first
+    waits on that service's shared rate limit. Latency is then set by the
+    slowest call, rather than the sum of them all.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    bucket = get_bucket(service) if service else None
+
+    def call(item):
+        if bucket:
+            bucket.acquire()
+        return func(item)
+
+    async def gather(loop, executor):
+        futures = [loop.run_in_executor(executor, call, item) for item in items]
+        return await asyncio.gather(*futures)
+
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        return loop.run_until_complete(gather(loop, executor))
+    finally:
+        executor.shutdown(wait=True)
+        loop.close()
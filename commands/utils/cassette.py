@@ -0,0 +1,216 @@
+import atexit
+import base64
+import collections
+import contextlib
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+# Query params that change every run (cache busters) or hold secrets.
+IGNORED_PARAMS = ['r', 'cachebuster', 'key', 'token']
+
+# Endpoints whose request bodies change every run, so are matched on
+# method and URL alone. Google's token requests post a JWT stamped with
+# the time it was made.
+UNHASHED_BODY_URLS = [
+    'https://oauth2.googleapis.com/token',
+    'https://accounts.google.com/o/oauth2/token',
+    'https://www.googleapis.com/oauth2/v4/token',
+]
+
+# Sent by our HTTP cache to revalidate what it has stored.
+CONDITIONAL_HEADERS = ['If-None-Match', 'If-Modified-Since']
+
+class CassetteMissError(Exception):
+    """Raised when replaying a request that was never recorded"""
+    pass
+
+def normalize_url(url):
+    url_data = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(url_data.query, keep_blank_values=True)
+             if k not in IGNORED_PARAMS]
+    query = urllib.parse.urlencode(sorted(query))
+    return urllib.parse.urlunsplit(url_data._replace(query=query))
+
+def request_key(method, url, body, headers=None):
+    content_type = CaseInsensitiveDict(headers or {}).get('Content-Type') or ''
+    url = normalize_url(url)
+    # Multipart bodies (e.g. Drive and Slack uploads) use a random boundary.
+    if url in UNHASHED_BODY_URLS or content_type.startswith('multipart/'):
+        body = None
+
+    if body is None:
+        body = b''
+    elif not isinstance(body, bytes):
+        body = str(body).encode('utf-8')
+    return '{} {} {}'.format(method.upper(), url, hashlib.sha1(body).hexdigest())
+
+class Cassette(object):
+    """Record real HTTP exchanges to a file, or replay them without a network.
+
+    Requests are hooked below every client we use: requests' HTTPAdapter
+    (Slack, Trello, Rebrandly, Meetup, GitHub, Sheets) and httplib2
+    (Google auth and Drive). In replay mode, each call can be delayed by
+    a fixed number of seconds, or by its recorded latency.
+    """
+
+    def __init__(self, path, mode='replay', latency=None):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.interactions = []
+        self._queues = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._patches = []
+        if mode == 'replay':
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        self.interactions = data['interactions']
+        for i in self.interactions:
+            self._queues[i['key']].append(i)
+
+    def save(self):
+        data = {'version': 1, 'interactions': self.interactions}
+        with open(self.path, 'w') as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+
+    def _record(self, key, url, status, headers, body, elapsed):
+        with self._lock:
+            self.interactions.append({
+                'key': key,
+                'url': normalize_url(url),
+                'status': status,
+                'headers': dict(headers),
+                'body': base64.b64encode(body).decode('ascii'),
+                'elapsed': elapsed,
+            })
+
+    def _replay(self, key):
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteMissError(key)
+            # Later identical requests get later responses, and the last repeats.
+            interaction = queue.popleft() if len(queue) > 1 else queue[0]
+
+        if self.latency == 'recorded':
+            time.sleep(interaction['elapsed'])
+        elif self.latency:
+            time.sleep(float(self.latency))
+        return interaction
+
+    def _adapter_send(self, send):
+        cassette = self
+
+        def patched_send(adapter, request, **kwargs):
+            key = request_key(request.method, request.url, request.body, request.headers)
+            if cassette.mode == 'record':
+                # Record full bodies, not 304s that only a warm local HTTP
+                # cache could serve on replay.
+                for header in CONDITIONAL_HEADERS:
+                    request.headers.pop(header, None)
+                start = time.monotonic()
+                response = send(adapter, request, **kwargs)
+                cassette._record(key, request.url, response.status_code, response.headers,
+                                 response.content, time.monotonic() - start)
+                return response
+
+            interaction = cassette._replay(key)
+            body = base64.b64decode(interaction['body'])
+            response = requests.Response()
+            response.status_code = interaction['status']
+            response.headers = CaseInsensitiveDict(interaction['headers'])
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            response.url = request.url
+            response.request = request
+            response.raw = io.BytesIO(body)
+            response._content = body
+            response._content_consumed = True
+            return response
+
+        return patched_send
+
+    def _httplib2_request(self, http_request):
+        cassette = self
+
+        def patched_request(http, uri, method='GET', body=None, headers=None, *args, **kwargs):
+            import httplib2
+            key = request_key(method, uri, body, headers)
+            if cassette.mode == 'record':
+                start = time.monotonic()
+                response, content = http_request(http, uri, method, body, headers, *args, **kwargs)
+                cassette._record(key, uri, response.status, response, content, time.monotonic() - start)
+                return response, content
+
+            interaction = cassette._replay(key)
+            info = dict(interaction['headers'], status=str(interaction['status']))
+            return httplib2.Response(info), base64.b64decode(interaction['body'])
+
+        return patched_request
+
+    def _patch(self, owner, name, wrap):
+        original = getattr(owner, name)
+        self._patches.append((owner, name, original))
+        setattr(owner, name, wrap(original))
+
+    def install(self):
+        self._patch(HTTPAdapter, 'send', self._adapter_send)
+        try:
+            import httplib2
+        except ImportError:
+            pass
+        else:
+            self._patch(httplib2.Http, 'request', self._httplib2_request)
+
+    def uninstall(self):
+        while self._patches:
+            owner, name, original = self._patches.pop()
+            setattr(owner, name, original)
+        if self.mode == 'record':
+            self.save()
+
+def default_mode(path):
+    # Replay a cassette that exists, otherwise record a new one.
+    return 'replay' if os.path.exists(path) else 'record'
+
+@contextlib.contextmanager
+def use_cassette(path, mode=None, latency=None):
+    if not path:
+        yield None
+        return
+
+    cassette = Cassette(path, mode=mode or default_mode(path), latency=latency)
+    cassette.install()
+    try:
+        yield cassette
+    finally:
+        cassette.uninstall()
+
+def install_from_env():
+    """Start a cassette for the rest of the process, if CTTO_CASSETTE is set.
+
+    Used by standalone scripts. CTTO_CASSETTE_MODE is "record" or "replay",
+    and CTTO_CASSETTE_LATENCY is seconds per call or "recorded".
+    """
+    path = os.getenv('CTTO_CASSETTE')
+    if not path:
+        return None
+
+    mode = os.getenv('CTTO_CASSETTE_MODE') or default_mode(path)
+    cassette = Cassette(path, mode=mode, latency=os.getenv('CTTO_CASSETTE_LATENCY'))
+    cassette.install()
+    atexit.register(cassette.uninstall)
+    return cassette
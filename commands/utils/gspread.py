@@ -3,6 +3,13 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
 
+# Ranges written per values:batchUpdate request.
+BATCH_UPDATE_SIZE = 500
+
+def a1_range(worksheet_title, a1):
+    """Qualify an A1 range with its worksheet, quoted as the Sheets API expects."""
+    return "'{}'!{}".format(worksheet_title.replace("'", "''"), a1)
+
 class CustomGSpread(object):
     scope = ['https://spreadsheets.google.com/feeds',
              'https://www.googleapis.com/auth/drive']
@@ -20,9 +27,18 @@ class CustomGSpread(object):
         ssheet = self.client.open_by_key(spreadsheet_key)
         wsheets = ssheet.worksheets()
         for ws in wsheets:
-            if str(ws.id) == worksheet_id:
+            if str(ws.id) == str(worksheet_id):
                 return ws
 
+    def batch_update_values(self, spreadsheet, data, batch_size=BATCH_UPDATE_SIZE):
+        """Write a list of {'range': ..., 'values': ...} dicts with as few requests as possible."""
+        for start in range(0, len(data), batch_size):
+            body = {
+                'valueInputOption': 'RAW',
+                'data': data[start:start+batch_size],
+            }
+            spreadsheet.values_batch_update(body)
+
     def values_to_dicts(self, values):
         header = values[0]
         range_data = []
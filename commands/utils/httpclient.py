@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import requests
+import urllib3
+
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+
+# Seconds to wait for a connection, and then for a response.
+DEFAULT_TIMEOUT = (5, 30)
+# Number of hosts to keep connection pools for, and connections per host.
+POOL_CONNECTIONS = 20
+POOL_MAXSIZE = 16
+
+# Where conditional-GET responses are kept between runs, unless
+# CTTO_HTTP_CACHE_DIR is set. That's read when the cache is created, so
+# scripts can load .env first.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'civictechto-scripts', 'http')
+# Bytes read at a time when finishing a body the caller stopped reading.
+DRAIN_CHUNK_SIZE = 64 * 1024
+# Response headers worth replaying when a cached body is served.
+CACHED_HEADERS = ['Content-Type', 'Content-Disposition', 'ETag', 'Last-Modified']
+
+_session = None
+_session_lock = threading.Lock()
+_cache = None
+
+def build_retry():
+    # Only idempotent methods are retried, with 0.5s, 1s, 2s between tries.
+    # 429s are left to the rate limiter, which paces every caller of a service.
+    return Retry(total=3,
+                 backoff_factor=0.5,
+                 status_forcelist=(500, 502, 503, 504),
+                 respect_retry_after_header=False,
+                 raise_on_status=False)
+
+class PooledSession(requests.Session):
+    """Session keeping warm connections to each host, with timeouts and retries."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                              pool_maxsize=POOL_MAXSIZE,
+                              max_retries=build_retry())
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+def get_session():
+    """Return the session shared by every command in this process."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession()
+    return _session
+
+def request(method, url, **kwargs):
+    return get_session().request(method, url, **kwargs)
+
+def get(url, params=None, **kwargs):
+    return get_session().get(url, params=params, **kwargs)
+
+def post(url, data=None, json=None, **kwargs):
+    return get_session().post(url, data=data, json=json, **kwargs)
+
+def delete(url, **kwargs):
+    return get_session().delete(url, **kwargs)
+
+class CachingReader(object):
+    """Wraps a streamed response body, copying it into the cache as it's read.
+
+    The copy is only stored once the body has been read to the end. If
+    the caller stops early, closing reads the rest, so the body is still
+    cached (the sources we stream are small).
+    """
+
+    def __init__(self, raw, tmp_file, on_complete):
+        self.raw = raw
+        self.tmp_file = tmp_file
+        self.on_complete = on_complete
+
+    def read(self, amt=None, **kwargs):
+        # requests leaves decompression to us when reading raw bodies.
+        chunk = self.raw.read(amt, decode_content=True)
+        if self.tmp_file:
+            if chunk:
+                self.tmp_file.write(chunk)
+            else:
+                self.tmp_file.close()
+                self.on_complete(self.tmp_file.name)
+                self.tmp_file = None
+        return chunk
+
+    def close(self):
+        if self.tmp_file:
+            try:
+                while self.read(DRAIN_CHUNK_SIZE):
+                    pass
+            except (OSError, urllib3.exceptions.HTTPError):
+                # The rest of the body never came, so there's nothing to keep.
+                self.tmp_file.close()
+                os.remove(self.tmp_file.name)
+                self.tmp_file = None
+        self.raw.close()
+
+    def release_conn(self):
+        release_conn = getattr(self.raw, 'release_conn', None)
+        if release_conn:
+            release_conn()
+
+class HTTPCache(object):
+    """On-disk cache of GET responses, revalidated with conditional requests.
+
+    Bodies are stored alongside their ETag and Last-Modified headers. Each
+    fetch still asks the server, but unchanged sources answer 304 and the
+    body is served from disk.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.getenv('CTTO_HTTP_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if not os.path.exists(path + '.body'):
+            return None
+        return meta
+
+    def _write(self, path, content):
+        # Write then rename, so readers never see a partial file.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _store_meta(self, key, response):
+        headers = {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+        meta = {'url': response.url, 'headers': headers}
+        self._write(self._path(key) + '.json', json.dumps(meta).encode('utf-8'))
+
+    def _store(self, key, response):
+        os.makedirs(self.directory, exist_ok=True)
+        self._write(self._path(key) + '.body', response.content)
+        self._store_meta(key, response)
+
+    def _store_streamed(self, key, response):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_file = tempfile.NamedTemporaryFile(dir=self.directory, delete=False)
+        except OSError:
+            return
+
+        def on_complete(tmp_path):
+            try:
+                os.replace(tmp_path, self._path(key) + '.body')
+                self._store_meta(key, response)
+            except OSError:
+                pass
+        response.raw = CachingReader(response.raw, tmp_file, on_complete)
+
+    def get(self, url, cache_key=None, stream=False, **kwargs):
+        """GET a url, revalidating any cached copy.
+
+        cache_key defaults to the url. Pass the url without cache busters
+        to bypass CDN caches while still sharing one cache entry. With
+        stream=True, the body is read from the network or disk as the
+        caller iterates over it, and stored once fully read.
+        """
+        key = cache_key or url
+        meta = self._load(key)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        if meta:
+            if 'ETag' in meta['headers']:
+                headers['If-None-Match'] = meta['headers']['ETag']
+            if 'Last-Modified' in meta['headers']:
+                headers['If-Modified-Since'] = meta['headers']['Last-Modified']
+
+        r = get(url, headers=headers, stream=stream, **kwargs)
+        r.from_cache = False
+        # Bodies already read (eg. by a cassette) can't be streamed.
+        stream = stream and not r._content_consumed
+        if r.status_code == requests.codes.not_modified and meta:
+            cached_headers = CaseInsensitiveDict(meta['headers'])
+            cached_headers.update(r.headers)
+            body_path = self._path(key) + '.body'
+            if stream:
+                # Release the connection, and read the body from disk instead.
+                r.close()
+                r.raw = open(body_path, 'rb')
+                r._content = False
+                r._content_consumed = False
+            else:
+                with open(body_path, 'rb') as f:
+                    r._content = f.read()
+            r.headers = cached_headers
+            r.status_code = requests.codes.ok
+            r.from_cache = True
+        elif r.status_code == requests.codes.ok and ('ETag' in r.headers or 'Last-Modified' in r.headers):
+            # A cache we can't write to shouldn't fail the run.
+            if stream:
+                self._store_streamed(key, r)
+            else:
+                try:
+                    self._store(key, r)
+                except OSError:
+                    pass
+
+        return r
+
+def get_cache():
+    global _cache
+    with _session_lock:
+        if _cache is None:
+            _cache = HTTPCache()
+    return _cache
+
+def cached_get(url, cache_key=None, stream=False, **kwargs):
+    return get_cache().get(url, cache_key=cache_key, stream=stream, **kwargs)
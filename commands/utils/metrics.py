@@ -0,0 +1,204 @@
+import atexit
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+from requests.adapters import HTTPAdapter
+
+
+# Service name for each API host we talk to.
+SERVICE_HOSTS = [
+    ('slack.com', 'slack'),
+    ('api.trello.com', 'trello'),
+    ('sheets.googleapis.com', 'gspread'),
+    ('spreadsheets.google.com', 'gspread'),
+    ('docs.google.com', 'gdocs'),
+    ('www.googleapis.com', 'drive'),
+    ('oauth2.googleapis.com', 'google-auth'),
+    ('accounts.google.com', 'google-auth'),
+    ('api.rebrandly.com', 'rebrandly'),
+    ('api.meetup.com', 'meetup'),
+    ('api.github.com', 'github'),
+    ('raw.githubusercontent.com', 'github'),
+    ('api.mailchimp.com', 'mailchimp'),
+]
+# Path segments that are ids, so calls group by endpoint rather than object.
+# Short numbers are left alone, as they're usually API versions.
+ID_SEGMENT_RE = re.compile(r'^(?:[0-9a-f]{24}|[0-9]{3,}|[A-Za-z0-9_-]{25,})$')
+
+def service_for_host(host):
+    for suffix, service in SERVICE_HOSTS:
+        if host == suffix or host.endswith('.' + suffix):
+            return service
+    return 'web'
+
+def endpoint_for_url(method, url):
+    url_data = urllib.parse.urlsplit(url)
+    segments = [':id' if ID_SEGMENT_RE.match(s) else s for s in url_data.path.split('/')]
+    return url_data.hostname or '', '{} {}'.format(method.upper(), '/'.join(segments))
+
+class Metrics(object):
+    """Per-endpoint tally of outbound API calls: count, status, latency and bytes."""
+
+    def __init__(self, command):
+        self.command = command
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._patches = []
+
+    def record(self, method, url, status, seconds, size):
+        host, endpoint = endpoint_for_url(method, url)
+        key = (service_for_host(host), endpoint, status)
+        with self._lock:
+            stats = self.endpoints.setdefault(key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['bytes'] += size
+
+    def _adapter_send(self, send):
+        metrics = self
+
+        def patched_send(adapter, request, **kwargs):
+            start = time.monotonic()
+            response = send(adapter, request, **kwargs)
+            if kwargs.get('stream'):
+                # Don't consume streamed bodies just to measure them.
+                size = int(response.headers.get('Content-Length', 0))
+            else:
+                size = len(response.content)
+            metrics.record(request.method, request.url, response.status_code, time.monotonic() - start, size)
+            return response
+
+        return patched_send
+
+    def _httplib2_request(self, http_request):
+        metrics = self
+
+        def patched_request(http, uri, method='GET', *args, **kwargs):
+            start = time.monotonic()
+            response, content = http_request(http, uri, method, *args, **kwargs)
+            metrics.record(method, uri, response.status, time.monotonic() - start, len(content or b''))
+            return response, content
+
+        return patched_request
+
+    def _patch(self, owner, name, wrap):
+        original = getattr(owner, name)
+        self._patches.append((owner, name, original))
+        setattr(owner, name, wrap(original))
+
+    def install(self):
+        self._patch(HTTPAdapter, 'send', self._adapter_send)
+        try:
+            import httplib2
+        except ImportError:
+            pass
+        else:
+            self._patch(httplib2.Http, 'request', self._httplib2_request)
+
+    def uninstall(self):
+        while self._patches:
+            owner, name, original = self._patches.pop()
+            setattr(owner, name, original)
+
+    def report(self):
+        wall_seconds = time.monotonic() - self._start
+        endpoints = []
+        for (service, endpoint, status), stats in self.endpoints.items():
+            row = dict(stats, service=service, endpoint=endpoint, status=status)
+            row['share_of_wall'] = stats['seconds'] / wall_seconds if wall_seconds else 0
+            endpoints.append(row)
+        endpoints.sort(key=lambda e: e['seconds'], reverse=True)
+
+        return {
+            'command': self.command,
+            'started_at': self.started_at,
+            'wall_seconds': wall_seconds,
+            'calls': sum(e['count'] for e in endpoints),
+            'endpoints': endpoints,
+        }
+
+    def to_prometheus(self, report):
+        escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"')
+        lines = []
+        metrics = [
+            ('ctto_api_requests_total', 'counter', 'API requests made.', 'count'),
+            ('ctto_api_request_seconds_total', 'counter', 'Time spent waiting on API requests.', 'seconds'),
+            ('ctto_api_response_bytes_total', 'counter', 'Bytes received from API responses.', 'bytes'),
+        ]
+        for name, kind, help_text, field in metrics:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for e in report['endpoints']:
+                labels = 'command="{}",service="{}",endpoint="{}",status="{}"'.format(
+                    escape(self.command), escape(e['service']), escape(e['endpoint']), e['status'])
+                lines.append('{}{{{}}} {}'.format(name, labels, e[field]))
+
+        lines.append('# HELP ctto_run_seconds Wall time of the last run.')
+        lines.append('# TYPE ctto_run_seconds gauge')
+        lines.append('ctto_run_seconds{{command="{}"}} {}'.format(escape(self.command), report['wall_seconds']))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path):
+        """Write a JSON report, or a Prometheus textfile if path ends in .prom."""
+        report = self.report()
+        if path.endswith('.prom'):
+            content = self.to_prometheus(report)
+        else:
+            content = json.dumps(report, indent=2) + '\n'
+
+        # Write then rename, as textfile collectors may read at any time.
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def collect_metrics(path, command):
+    if not path:
+        yield None
+        return
+
+    metrics = Metrics(command)
+    metrics.install()
+    try:
+        yield metrics
+    finally:
+        metrics.uninstall()
+        metrics.write_report(path)
+
+def install_from_env(command):
+    """Collect metrics for the rest of the process, if CTTO_METRICS_REPORT is set.
+
+    Used by standalone scripts. The report is written at exit.
+    """
+    path = os.getenv('CTTO_METRICS_REPORT')
+    if not path:
+        return None
+
+    metrics = Metrics(command)
+    metrics.install()
+
+    def finish():
+        metrics.uninstall()
+        metrics.write_report(path)
+    atexit.register(finish)
+    return metrics
+
+def instrument_script(command):
+    """Record or replay API calls, and report on them, for a standalone script.
+
+    Each only starts if CTTO_CASSETTE or CTTO_METRICS_REPORT is set. The
+    cassette goes first so metrics wrap it, and replayed calls are
+    measured too.
+    """
+    from commands.utils import cassette
+    cassette.install_from_env()
+    return install_from_env(command)
@@ -0,0 +1,238 @@
+import copy
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import requests
+import time
+
+from datetime import datetime
+
+from commands.utils import httpclient
+
+
+DATASET_BASE_URL = 'https://raw.githubusercontent.com/CivicTechTO/dataset-civictechto-breakout-groups/master/'
+DATASET_PATH = 'data/civictechto-breakout-groups.csv'
+DATASET_URL = DATASET_BASE_URL + DATASET_PATH
+# Partitioned layout: one CSV per year, plus a manifest of per-project aggregates.
+PARTITION_PATH = 'data/partitions/civictechto-breakout-groups-{year}.csv'
+MANIFEST_PATH = 'data/manifest.json'
+MANIFEST_URL = DATASET_BASE_URL + MANIFEST_PATH
+# Either "flat" for the single CSV, or "partitioned".
+DEFAULT_LAYOUT = 'flat'
+DATE_FORMAT = '%Y-%m-%d'
+# Epoch time used as a cache buster for the raw GitHub url, so the CDN
+# always asks GitHub. Unchanged files are still served from our own cache.
+NONCE = int(time.time())
+
+# Indexes already built in this process, keyed by dataset url.
+_history_cache = {}
+
+def fetch_dataset(url=DATASET_URL):
+    """Download the raw CSV content of the pitch dataset."""
+    r = httpclient.cached_get('{}?r={}'.format(url, NONCE), cache_key=url)
+    # A 304 served from our cache comes back as 200, so anything else
+    # (eg. a 304 with nothing cached) has no usable body.
+    if r.status_code != requests.codes.ok:
+        r.raise_for_status()
+        raise requests.HTTPError('Unexpected HTTP {} for {}'.format(r.status_code, url), response=r)
+    return r.content.decode('utf-8')
+
+def git_blob_sha(content):
+    """Return the git blob hash of some bytes, as reported by GitHub for files."""
+    header = 'blob {}\0'.format(len(content)).encode('utf-8')
+    return hashlib.sha1(header + content).hexdigest()
+
+def replace_date_rows(content, date, rows):
+    """Replace the rows for one date at the end of raw dataset CSV content.
+
+    New hacknights are always appended, so only the tail of the content
+    is inspected and the rest is kept as-is. Work done tracks the number
+    of rows for that date, not the size of the dataset.
+    """
+    header = content[:content.find('\n')]
+    newline = '\r\n' if header.endswith('\r') else '\n'
+    fieldnames = next(csv.reader([header.rstrip('\r')]))
+
+    # Walk back over trailing lines that belong to this date.
+    prefix = date + ','
+    body = content.rstrip('\r\n')
+    cut = len(body)
+    while True:
+        line_start = body.rfind('\n', 0, cut) + 1
+        if line_start == 0 or not body.startswith(prefix, line_start):
+            break
+        cut = line_start - 1
+
+    tail = io.StringIO()
+    writer = csv.DictWriter(tail, fieldnames=fieldnames, lineterminator=newline)
+    writer.writerows(rows)
+    return body[:cut].rstrip('\r') + newline + tail.getvalue()
+
+class ProjectHistory(object):
+    pitch_count = 0
+    streak_count = 0
+    last_pitch_date = None
+
+class PitchHistory(object):
+    """Index of pitch history keyed by trello_card_id, built in one pass."""
+
+    def __init__(self, rows=()):
+        self.projects = {}
+        self._build_index(rows)
+
+    @classmethod
+    def from_url(cls, url=DATASET_URL):
+        reader = csv.DictReader(fetch_dataset(url).splitlines(), delimiter=',')
+        return cls(reader)
+
+    @classmethod
+    def from_manifest(cls, manifest):
+        """Build the index from manifest aggregates, without reading any rows."""
+        history = cls()
+        for card_id, aggregate in manifest['projects'].items():
+            project = ProjectHistory()
+            project.pitch_count = aggregate['pitch_count']
+            project.last_pitch_date = datetime.strptime(aggregate['last_pitch_date'], DATE_FORMAT)
+            # Streaks are only current if the project pitched on the latest date.
+            if aggregate['last_pitch_date'] == manifest['latest_date']:
+                project.streak_count = aggregate['streak_count']
+            history.projects[card_id] = project
+
+        return history
+
+    def _build_index(self, rows):
+        rows = sorted(rows, key=lambda i: i['date'], reverse=True)
+
+        # Rank of each distinct date, counting back from the most recent.
+        rank = -1
+        previous_date = None
+        for row in rows:
+            if row['date'] != previous_date:
+                previous_date = row['date']
+                rank += 1
+
+            project = self.projects.get(row['trello_card_id'])
+            if not project:
+                project = ProjectHistory()
+                # Rows are newest first, so the first one seen is the last pitch.
+                project.last_pitch_date = datetime.strptime(row['date'], DATE_FORMAT)
+                self.projects[row['trello_card_id']] = project
+
+            project.pitch_count += 1
+
+            # Streak only grows while the card appears on every date so far.
+            if project.streak_count == rank:
+                project.streak_count += 1
+
+    def get(self, card_id):
+        return self.projects.get(card_id)
+
+def dataset_layout():
+    # Read when used, so scripts can load .env after importing this module.
+    return os.getenv('PITCH_DATASET_LAYOUT', DEFAULT_LAYOUT)
+
+def get_pitch_history(layout=None):
+    """Return the pitch history index, downloading it at most once per process."""
+    layout = layout or dataset_layout()
+    if layout not in _history_cache:
+        if layout == 'partitioned':
+            _history_cache[layout] = PitchHistory.from_manifest(fetch_manifest())
+        else:
+            _history_cache[layout] = PitchHistory.from_url(DATASET_URL)
+
+    return _history_cache[layout]
+
+def fetch_manifest(url=MANIFEST_URL):
+    return json.loads(fetch_dataset(url))
+
+def partition_path(year):
+    return PARTITION_PATH.format(year=year)
+
+def fetch_partition(year):
+    """Return the rows of one year's partition, or none if it doesn't exist yet."""
+    try:
+        content = fetch_dataset(DATASET_BASE_URL + partition_path(year))
+    except requests.HTTPError as e:
+        if e.response.status_code == 404:
+            return []
+        raise
+    return list(csv.DictReader(content.splitlines(), delimiter=','))
+
+def fold_rows(state, rows):
+    """Apply rows, oldest first, to a copy of aggregate state and return it.
+
+    State holds the latest date seen and, per trello_card_id, the pitch
+    count, last pitch date and streak as of that project's last pitch.
+    """
+    state = copy.deepcopy(state)
+    projects = state['projects']
+    rows = sorted(rows, key=lambda i: i['date'])
+    for date, group in itertools.groupby(rows, key=lambda i: i['date']):
+        previous_date = state['latest_date']
+        for row in group:
+            project = projects.setdefault(row['trello_card_id'], {
+                'pitch_count': 0,
+                'last_pitch_date': None,
+                'streak_count': 0,
+            })
+            project['pitch_count'] += 1
+            # Count each date once towards the streak.
+            if project['last_pitch_date'] != date:
+                if project['last_pitch_date'] == previous_date:
+                    project['streak_count'] += 1
+                else:
+                    project['streak_count'] = 1
+                project['last_pitch_date'] = date
+        state['latest_date'] = date
+
+    return state
+
+def build_manifest(rows, fieldnames):
+    """Split flat dataset rows into yearly partitions, and build their manifest."""
+    manifest = {
+        'fieldnames': fieldnames,
+        'latest_date': None,
+        'partitions': {},
+        'projects': {},
+    }
+    partitions = {}
+    rows = sorted(rows, key=lambda i: i['date'])
+    for year, group in itertools.groupby(rows, key=lambda i: i['date'][:4]):
+        partitions[year] = list(group)
+        manifest = update_manifest(manifest, year, partitions[year])
+
+    return manifest, partitions
+
+def update_manifest(manifest, year, rows):
+    """Return the manifest with the given year's partition rows (re)applied.
+
+    Each partition records the aggregates from before its first row, so
+    rewriting the current year only needs that year's rows.
+    """
+    manifest = copy.deepcopy(manifest)
+    partition = manifest['partitions'].get(year)
+    if not partition:
+        partition = {
+            'path': partition_path(year),
+            'base': {
+                'latest_date': manifest['latest_date'],
+                'projects': manifest['projects'],
+            },
+        }
+        manifest['partitions'][year] = partition
+
+    partition['rows'] = len(rows)
+    state = fold_rows(partition['base'], rows)
+    manifest['latest_date'] = state['latest_date']
+    manifest['projects'] = state['projects']
+    return manifest
+
+def write_csv(fieldnames, rows):
+    csvfile = io.StringIO()
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+    writer.writeheader()
+    writer.writerows(rows)
+    return csvfile.getvalue()
@@ -0,0 +1,210 @@
+import email.utils
+import threading
+import time
+
+import requests
+
+from requests.structures import CaseInsensitiveDict
+
+
+# Trello allows 100 requests per 10 second interval for each token.
+# See: https://developer.atlassian.com/cloud/trello/guides/rest-api/rate-limits/
+TRELLO_RATE = (100, 10)
+
+# Slack limits each method separately, in tiers of requests per minute.
+# See: https://api.slack.com/docs/rate-limits
+SLACK_TIER_RATES = {
+    'tier1': (1, 60),
+    'tier2': (20, 60),
+    'tier3': (50, 60),
+    'tier4': (100, 60),
+    # Posting messages is limited to about one per second.
+    'post': (1, 1),
+}
+SLACK_METHOD_TIERS = {
+    'chat.postMessage': 'post',
+    'conversations.info': 'tier3',
+    'conversations.list': 'tier2',
+    'conversations.members': 'tier4',
+    'im.list': 'tier2',
+    'users.info': 'tier4',
+    'users.list': 'tier2',
+}
+SLACK_DEFAULT_TIER = 'tier3'
+
+# Requests allowed per number of seconds, for each service we call.
+SERVICE_RATES = {
+    'trello': TRELLO_RATE,
+    'rebrandly': (10, 1),
+    # See: https://www.meetup.com/meetup_api/docs/#limits
+    'meetup': (30, 10),
+}
+
+# Times to retry a throttled call before giving up.
+MAX_RETRIES = 5
+# After being throttled, a bucket slows to half its rate (but no less than
+# this fraction of it), then recovers by this fraction after each success.
+MIN_RATE_FRACTION = 0.1
+RECOVERY_STEP = 0.05
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+class TokenBucket(object):
+    """Thread-safe token bucket allowing `rate` calls every `per` seconds."""
+
+    def __init__(self, rate, per=1.0):
+        self.capacity = float(rate)
+        self.max_fill_rate = rate / float(per)
+        self.fill_rate = self.max_fill_rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        # Time before which nobody may proceed, eg. after a Retry-After.
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.fill_rate)
+        self.updated_at = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            # Start from empty once the pause is over, rather than bursting.
+            self.tokens = 0
+
+    def throttle(self, seconds):
+        """Pause after being throttled, then continue at a slower rate."""
+        self.pause(seconds)
+        with self._lock:
+            self.fill_rate = max(self.fill_rate / 2, self.max_fill_rate * MIN_RATE_FRACTION)
+
+    def recover(self):
+        with self._lock:
+            self.fill_rate = min(self.max_fill_rate, self.fill_rate + self.max_fill_rate * RECOVERY_STEP)
+
+def retry_after_seconds(headers, default=1.0):
+    """Parse a Retry-After header, given either in seconds or as an HTTP date."""
+    value = CaseInsensitiveDict(headers or {}).get('Retry-After')
+    if not value:
+        return default
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max(0.0, retry_at.timestamp() - time.time())
+
+def call_with_retries(bucket, call, retry_after, max_retries=MAX_RETRIES):
+    """Make a call once the bucket allows it, retrying while it's throttled.
+
+    retry_after(result, attempt) returns seconds to wait if the result was
+    throttled, or None. The last throttled result is returned if retries
+    run out.
+    """
+    attempt = 0
+    while True:
+        bucket.acquire()
+        result = call()
+        delay = retry_after(result, attempt)
+        if delay is None:
+            bucket.recover()
+            return result
+        if attempt >= max_retries:
+            return result
+
+        bucket.throttle(delay)
+        attempt += 1
+
+class RateLimitedService(object):
+    """Drop-in `http_service` for clients like TrelloClient.
+
+    Each request waits for a token, and 429 responses are retried after
+    the delay asked for in Retry-After. Counts are kept for run summaries.
+    """
+
+    def __init__(self, bucket, http=requests, max_retries=MAX_RETRIES):
+        self.bucket = bucket
+        self.http = http
+        self.max_retries = max_retries
+        self.calls = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        def call():
+            with self._lock:
+                self.calls += 1
+            return self.http.request(method, url, **kwargs)
+
+        def retry_after(response, attempt):
+            if response.status_code != 429:
+                return None
+            with self._lock:
+                self.throttled += 1
+            # Back off exponentially if the server doesn't say how long.
+            return retry_after_seconds(response.headers, default=2 ** attempt)
+
+        return call_with_retries(self.bucket, call, retry_after, self.max_retries)
+
+    # Session-style helpers, for clients that hold a requests.Session.
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+def bucket_name(service, method=None):
+    if service == 'slack':
+        return 'slack:{}'.format(method)
+    return service
+
+def bucket_rate(service, method=None):
+    if service == 'slack':
+        return SLACK_TIER_RATES[SLACK_METHOD_TIERS.get(method, SLACK_DEFAULT_TIER)]
+    return SERVICE_RATES.get(service)
+
+def get_bucket(service, method=None):
+    """Return the token bucket shared by all callers of a service, if it's limited.
+
+    Slack buckets are per method, at the rate of its tier, so pass the
+    method being called.
+    """
+    rate = bucket_rate(service, method)
+    if rate is None:
+        return None
+
+    name = bucket_name(service, method)
+    with _buckets_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(*rate)
+    return _buckets[name]
+
+def get_service(service):
+    """Return a rate-limited http service on the shared pooled session."""
+    # Imported here, as httpclient is heavier than this module.
+    from commands.utils import httpclient
+    return RateLimitedService(get_bucket(service), http=httpclient.get_session())
@@ -1,5 +1,7 @@
 import requests
 
+from commands.utils.ratelimit import get_service
+
 class Error(Exception):
     """Base class for other exceptions"""
     pass
@@ -12,6 +14,13 @@ class AmbiguousCustomDomainError(Error):
     """Raised when unable to auto-detect a custom domain on Rebrandly account"""
     pass
 
+class RequestError(Error):
+    """Raised when the Rebrandly API responds with an error"""
+    def __init__(self, response):
+        super().__init__('{} {} returned {}: {}'.format(
+            response.request.method, response.url, response.status_code, response.text))
+        self.response = response
+
 class Rebrandly(object):
     api_key = ''
     base_uri = 'https://api.rebrandly.com/v1'
@@ -20,6 +29,8 @@ class Rebrandly(object):
 
     def __init__(self, api_key):
         self.api_key = api_key
+        # Calls are paced to our rate limit, and retried if throttled.
+        self.http = get_service('rebrandly')
         self._fetch_domains()
 
     def _build_url(self, path):
@@ -29,20 +40,27 @@ class Rebrandly(object):
         r = self.get('/domains')
         self.domains = r.json()
 
-    def get(self, path, data={}):
-        if self.default_domain:
-            data.update({})
+    def request(self, method, path, **kwargs):
         url = self._build_url(path)
         headers = { 'apikey': self.api_key }
-        r = requests.get(url,
-                         data,
-                         headers=headers)
+        r = self.http.request(method, url, headers=headers, **kwargs)
 
         if r.status_code != requests.codes.ok:
-            raise
+            raise RequestError(r)
 
         return r
 
+    def get(self, path, data={}):
+        if self.default_domain:
+            data.update({})
+        return self.request('GET', path, params=data)
+
+    def post(self, path, data):
+        return self.request('POST', path, json=data)
+
+    def delete(self, path):
+        return self.request('DELETE', path)
+
     def get_custom_domains(self):
         # Ignore service shortlink domains like rebrand.ly itself.
         my_domains = [d for d in self.domains if d['type'].lower() != 'service']
@@ -0,0 +1,103 @@
+import codecs
+import csv
+import re
+import urllib.parse
+
+import requests
+
+from commands.common import parse_gdoc_url
+from commands.utils import httpclient
+
+
+CSV_URL_TEMPLATE = 'https://docs.google.com/spreadsheets/d/{key}/export?format=csv&id={key}&gid={id}'
+# Bytes read from the export at a time.
+CHUNK_SIZE = 64 * 1024
+
+class SheetFetchError(Exception):
+    """Raised when a spreadsheet's CSV export can't be fetched"""
+    pass
+
+def parse_content_disposition_title(header):
+    """Return the download filename from a Content-Disposition header, without .csv."""
+    if not header:
+        return None
+
+    # See: https://tools.ietf.org/html/rfc5987#section-3.2.1 (ext-value definition)
+    m = re.search("filename\*=(?P<charset>.+)'(?P<language>.*)'(?P<filename>.+)", header)
+    if m:
+        filename = urllib.parse.unquote(m.group('filename'), encoding=m.group('charset') or 'utf-8')
+    else:
+        m = re.search('filename="(?P<filename>[^"]+)"', header)
+        if not m:
+            return None
+        filename = m.group('filename')
+
+    # Remove csv filename suffix.
+    if filename.endswith('.csv'):
+        filename = filename[:-len('.csv')]
+    return filename
+
+class SheetSource(object):
+    """A publicly readable Google Sheet, read from its CSV export.
+
+    The export is streamed, so rows can be used as they arrive and the
+    whole sheet is never held in memory at once (unless the caller keeps
+    every row). Cells spanning several lines are kept intact.
+    """
+
+    def __init__(self, url, chunk_size=CHUNK_SIZE):
+        self.url = url
+        self.key, self.worksheet_id = parse_gdoc_url(url)
+        self.csv_url = CSV_URL_TEMPLATE.format(key=self.key, id=self.worksheet_id)
+        self.chunk_size = chunk_size
+        self.response = None
+
+    def fetch(self):
+        r = httpclient.cached_get(self.csv_url, stream=True)
+        if r.status_code != requests.codes.ok:
+            r.close()
+            raise SheetFetchError('Could not fetch {}: HTTP {}'.format(self.csv_url, r.status_code))
+        self.response = r
+        return self
+
+    @property
+    def title(self):
+        """Spreadsheet and worksheet name, as given in the download filename."""
+        if self.response is None:
+            self.fetch()
+        return parse_content_disposition_title(self.response.headers.get('Content-Disposition'))
+
+    @property
+    def version(self):
+        """ETag or Last-Modified of the export, if any, to tell when it changes."""
+        if self.response is None:
+            self.fetch()
+        return self.response.headers.get('ETag') or self.response.headers.get('Last-Modified')
+
+    def lines(self):
+        """Yield decoded lines of the export, with line endings, as they download."""
+        if self.response is None:
+            self.fetch()
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        pending = ''
+        try:
+            for chunk in self.response.iter_content(self.chunk_size):
+                pending += decoder.decode(chunk)
+                # Hold back the last, possibly incomplete, line.
+                *complete, pending = pending.split('\n')
+                for line in complete:
+                    yield line + '\n'
+            pending += decoder.decode(b'', final=True)
+            if pending:
+                yield pending
+        finally:
+            self.close()
+
+    def rows(self, reader=csv.DictReader):
+        """Iterate over rows as dicts, parsed by a csv.DictReader-like class."""
+        return reader(self.lines(), delimiter=',')
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
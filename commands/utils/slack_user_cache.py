@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Where Slack user profiles are kept between runs, unless
+# CTTO_SLACK_USER_CACHE is set. Set it to an empty string to always fetch
+# users from Slack.
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'civictechto-scripts', 'slack-users.sqlite3')
+# Seconds before a cached user is fetched again, unless
+# CTTO_SLACK_USER_CACHE_MAX_AGE is set.
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    updated INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+
+class SlackUserCache(object):
+    """SQLite store of Slack user profiles, keyed by user ID.
+
+    Each row keeps the user's `updated` timestamp from Slack, and when we
+    last saw it. Users seen within max_age are served without calling
+    Slack, and a profile is only rewritten when its `updated` has moved.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_age=DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute(SCHEMA)
+
+    def get_many(self, user_ids, now=None):
+        """Return fresh cached users for the given IDs, by ID."""
+        now = time.time() if now is None else now
+        user_ids = list(set(user_ids))
+        users = {}
+        with self.lock:
+            # Stay under SQLite's limit on query parameters.
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start+500]
+                rows = self.db.execute(
+                    'SELECT data FROM users WHERE fetched_at >= ? AND id IN ({})'.format(','.join('?' * len(chunk))),
+                    [now - self.max_age] + chunk)
+                for (data,) in rows:
+                    user = json.loads(data)
+                    users[user['id']] = user
+        return users
+
+    def store(self, users, now=None):
+        """Save users just fetched from Slack, rewriting only changed profiles."""
+        now = time.time() if now is None else now
+        users = list(users)
+        with self.lock, self.db:
+            known = {}
+            for start in range(0, len(users), 500):
+                chunk = [u['id'] for u in users[start:start+500]]
+                rows = self.db.execute(
+                    'SELECT id, updated FROM users WHERE id IN ({})'.format(','.join('?' * len(chunk))),
+                    chunk)
+                known.update(rows)
+
+            changed = [u for u in users if known.get(u['id']) != u.get('updated', 0)]
+            unchanged = [u for u in users if known.get(u['id']) == u.get('updated', 0)]
+            self.db.executemany(
+                'INSERT OR REPLACE INTO users (id, updated, fetched_at, data) VALUES (?, ?, ?, ?)',
+                [(u['id'], u.get('updated', 0), now, json.dumps(u)) for u in changed])
+            self.db.executemany(
+                'UPDATE users SET fetched_at = ? WHERE id = ?',
+                [(now, u['id']) for u in unchanged])
+        return len(changed)
+
+    def close(self):
+        self.db.close()
+
+def from_env():
+    """Return a cache at CTTO_SLACK_USER_CACHE, or None if it's disabled.
+
+    Settings are read here, so scripts can load .env first.
+    """
+    path = os.getenv('CTTO_SLACK_USER_CACHE', DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    max_age = int(os.getenv('CTTO_SLACK_USER_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+    return SlackUserCache(path, max_age=max_age)
@@ -1,24 +1,168 @@
 import re
 
+from requests.structures import CaseInsensitiveDict
 from slackclient import SlackClient
+from slackclient.slackrequest import SlackRequest
+
+from commands.utils import httpclient, slack_user_cache
+from commands.utils.batch import run_batch
+from commands.utils.ratelimit import call_with_retries, get_bucket, retry_after_seconds
+
+# Page sizes. Slack recommends no more than 200 users per page, and
+# allows up to 1000 channel members.
+USERS_PAGE_SIZE = 200
+CHANNELS_PAGE_SIZE = 200
+MEMBERS_PAGE_SIZE = 1000
+# Above this many uncached users, crawl users.list rather than calling
+# users.info for each.
+USERS_INFO_MAX = 50
+
+# Public, private and DM conversation IDs.
+CHANNEL_ID_RE = re.compile('^[CGD][A-Z0-9]{8,}$')
+
+class SlackApiError(Exception):
+    """Raised when a Slack API call isn't ok"""
+    pass
+
+class PooledSlackRequest(SlackRequest):
+    # Same as SlackRequest, but sends through the shared pooled session.
+    def post_http_request(self, token, api_method, post_data,
+                          files=None, timeout=None, domain='slack.com'):
+        if post_data is not None and 'token' in post_data:
+            token = post_data['token']
+
+        headers = {
+            'user-agent': self.get_user_agent(),
+            'Authorization': 'Bearer {}'.format(token)
+        }
+
+        return httpclient.post(
+            'https://{0}/api/{1}'.format(domain, api_method),
+            headers=headers,
+            data=post_data,
+            files=files,
+            timeout=timeout,
+            proxies=self.proxies
+        )
 
 class CustomSlackClient(SlackClient):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.server.api_requester = PooledSlackRequest(proxies=self.server.proxies)
+        self.user_directory = None
+        self._user_cache = None
 
-    def get_user_members(self, channel_id):
-        res = self.api_call('conversations.members', channel=channel_id)
-        member_ids = res['members']
-        members = []
-        for mid in member_ids:
-            res = self.api_call('users.info', user=mid)
-            m = res['user']
-            if m['is_bot']:
-                continue
-            members.append(m)
+    @property
+    def user_cache(self):
+        # Opened on first use, so clients that never look up users don't touch it.
+        if self._user_cache is None:
+            self._user_cache = slack_user_cache.from_env() or False
+        return self._user_cache or None
+
+    def api_call(self, method, timeout=None, **kwargs):
+        # Pace calls to each method's rate limit tier, and retry when Slack
+        # answers "ratelimited", after the Retry-After it sends.
+        def call():
+            return super(CustomSlackClient, self).api_call(method, timeout=timeout, **kwargs)
+
+        def retry_after(res, attempt):
+            headers = CaseInsensitiveDict(res.get('headers') or {})
+            if res.get('ok') or (res.get('error') != 'ratelimited' and 'Retry-After' not in headers):
+                return None
+            return retry_after_seconds(headers, default=2 ** attempt)
+
+        return call_with_retries(get_bucket('slack', method), call, retry_after)
+
+    def paginate(self, method, key, **kwargs):
+        """Yield every item under `key`, following response_metadata cursors."""
+        cursor = None
+        while True:
+            if cursor:
+                kwargs['cursor'] = cursor
+            res = self.api_call(method, **kwargs)
+            if not res.get('ok'):
+                raise SlackApiError('{} failed: {}'.format(method, res.get('error')))
+            yield from res.get(key, [])
+            cursor = res.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return
+
+    def get_user_directory(self, refresh=False):
+        """Return every workspace user, by ID, fetched in bulk from users.list."""
+        if self.user_directory is None or refresh:
+            users = list(self.paginate('users.list', 'members', limit=USERS_PAGE_SIZE))
+            if self.user_cache:
+                self.user_cache.store(users)
+            self.user_directory = {u['id']: u for u in users}
+        return self.user_directory
+
+    def get_member_ids(self, channel_id):
+        return list(self.paginate('conversations.members', 'members',
+                                  channel=channel_id, limit=MEMBERS_PAGE_SIZE))
+
+    def get_users(self, user_ids):
+        """Return users for the given IDs, in order.
+
+        Users are served from the local cache when fresh. Otherwise they're
+        fetched with users.info, or from the whole directory when many are
+        missing.
+        """
+        users = self.user_cache.get_many(user_ids) if self.user_cache else {}
+        missing = [uid for uid in dict.fromkeys(user_ids) if uid not in users]
+
+        if missing and (self.user_directory is not None or len(missing) > USERS_INFO_MAX):
+            directory = self.get_user_directory()
+            users.update({uid: directory[uid] for uid in missing if uid in directory})
+            missing = [uid for uid in missing if uid not in users]
+
+        # Users who joined since the directory was fetched.
+        if missing:
+            results = run_batch(lambda uid: self.api_call('users.info', user=uid), missing)
+            fetched = [res['user'] for res in results if res.get('ok')]
+            if self.user_cache:
+                self.user_cache.store(fetched)
+            users.update({u['id']: u for u in fetched})
+
+        return [users[uid] for uid in user_ids if uid in users]
+
+    def get_channels(self, types='public_channel,private_channel', exclude_archived=True):
+        """Return every conversation of the given types, paging through conversations.list."""
+        return list(self.paginate('conversations.list', 'channels', types=types,
+                                  exclude_archived=exclude_archived, limit=CHANNELS_PAGE_SIZE))
+
+    def resolve_channels(self, channels):
+        """Return channel info for each name (with or without #) or ID, in order.
+
+        Names are looked up in one listing of every channel. When only IDs
+        are given, each is looked up with conversations.info instead.
+        """
+        channels = [c.lstrip('#') for c in channels]
+        if all(CHANNEL_ID_RE.match(c) for c in channels):
+            results = run_batch(lambda c: self.api_call('conversations.info', channel=c), channels)
+            found = {c: res['channel'] for c, res in zip(channels, results) if res.get('ok')}
+        else:
+            found = {}
+            for info in self.get_channels():
+                found[info['id']] = info
+                found.setdefault(info['name'], info)
+
+        missing = [c for c in channels if c not in found]
+        if missing:
+            raise SlackApiError('Channels not found: {}'.format(', '.join(missing)))
+        return [found[c] for c in channels]
+
+    def get_channels_members(self, channel_ids):
+        """Return the human members of any of the channels, each fetched once."""
+        member_lists = run_batch(self.get_member_ids, channel_ids)
+        member_ids = [mid for members in member_lists for mid in members]
+        users = self.get_users(list(dict.fromkeys(member_ids)))
+        members = [u for u in users if not u['is_bot']]
 
         return members
 
+    def get_user_members(self, channel_id):
+        return self.get_channels_members([channel_id])
+
     def bot_message(self, channel, text, thread_ts=None):
         kwargs = {
             'channel': channel,
@@ -1,18 +1,18 @@
-import csv
-import itertools
+import collections
+import json
 import re
-import requests
-import time
 
 from datetime import datetime
 
+from commands.utils.pitch_dataset import ProjectHistory, get_pitch_history
+
 
 class BreakoutGroup(object):
     CHAT_RE = re.compile('^(?:slack|chat): (\S+)$', flags=re.IGNORECASE)
     PITCHER_RE = re.compile('pitchers?:? ?(.+)', flags=re.IGNORECASE)
-    NONCE = int(time.time())
 
     card = None
+    history = None
     name = str()
     chat_room = str()
     pitcher = str()
@@ -22,8 +22,10 @@ class BreakoutGroup(object):
     # If no record, assume very old.
     last_pitch_date = datetime(2016, 8, 1)
 
-    def __init__(self, card):
+    def __init__(self, card, history=None):
         self.card = card
+        # Share one pitch history index across all cards in this process.
+        self.history = history or get_pitch_history()
         self.generate_from_trello_card()
         self._process_historical_data()
 
@@ -33,38 +35,12 @@ class BreakoutGroup(object):
         self.pitcher = self._get_pitcher()
 
     def _process_historical_data(self):
-        dataset_url = 'https://raw.githubusercontent.com/CivicTechTO/dataset-civictechto-breakout-groups/master/data/civictechto-breakout-groups.csv?r={}'.format(self.NONCE)
-        r = requests.get(dataset_url)
-        csv_content = r.content.decode('utf-8')
-        csv_content = csv_content.splitlines()
-        reader = csv.DictReader(csv_content, delimiter=',')
-        all_pitches = list(reader)
-        all_pitches = sorted(all_pitches, key=lambda i: i['date'], reverse=True)
-
-        # Tally pitch count.
-        self.pitch_count = 0
-        for row in all_pitches:
-            if row['trello_card_id'] == self.card.id:
-                self.pitch_count += 1
-
-        if self.pitch_count == 1:
-            self.is_new = True
-
-        # Get last pitch date.
-        for row in all_pitches:
-            if row['trello_card_id'] == self.card.id:
-                self.last_pitch_date = datetime.strptime(row['date'], '%Y-%m-%d')
-                break
-
-        # Tally streak count.
-        self.streak_count = 0
-        for key, group in itertools.groupby(all_pitches, key=lambda i: i['date']):
-            matches = [p for p in group if p['trello_card_id'] == self.card.id]
-            if matches:
-                self.streak_count += 1
-                continue
-            else:
-                break
+        # Set on the instance even without history, as callers use vars().
+        project = self.history.get(self.card.id) or ProjectHistory()
+        self.pitch_count = project.pitch_count
+        self.streak_count = project.streak_count
+        self.last_pitch_date = project.last_pitch_date or self.last_pitch_date
+        self.is_new = self.pitch_count == 1
 
     def _get_chat_room(self):
         attachments = self.card.get_attachments()
@@ -86,3 +62,157 @@ class BreakoutGroup(object):
                 return match.group(1)
 
         return ''
+
+Attachment = collections.namedtuple('Attachment', ['id', 'name', 'url'])
+Member = collections.namedtuple('Member', ['id', 'username', 'full_name'])
+
+class SnapshotCard(object):
+    """Card backed by a board snapshot, with the py-trello Card methods BreakoutGroup needs."""
+
+    def __init__(self, board, card_json):
+        self.board = board
+        self.id = card_json['id']
+        self.name = card_json['name']
+        self.url = card_json.get('url', '')
+        self.list_id = card_json['idList']
+        self.member_ids = card_json.get('idMembers', [])
+        self.attachments = [Attachment(a['id'], a['name'], a.get('url', '')) for a in card_json.get('attachments', [])]
+
+    def get_attachments(self):
+        return list(self.attachments)
+
+    def get_comments(self):
+        # Oldest first, same as py-trello.
+        return sorted(self.board.comments_by_card.get(self.id, []), key=lambda c: c['date'])
+
+    def change_list(self, list_id):
+        if not self.board.client:
+            raise RuntimeError('Cannot move cards on an offline board snapshot')
+        self.board.client.fetch_json(
+            '/cards/' + self.id + '/idList',
+            http_method='PUT',
+            post_args={'value': list_id})
+        self.list_id = list_id
+
+def id_timestamp(trello_id):
+    # Trello IDs start with their creation time, in hex seconds.
+    return int(trello_id[:8], 16)
+
+class SnapshotList(object):
+    def __init__(self, board, list_json):
+        self.board = board
+        self.id = list_json['id']
+        self.name = list_json['name']
+        self.closed = list_json.get('closed', False)
+
+    def list_cards(self):
+        return list(self.board.cards_by_list.get(self.id, []))
+
+class BoardSnapshot(object):
+    """In-memory copy of a Trello board, fetched in one bulk request.
+
+    Boards with more comments than fit in that request have older ones
+    paged in afterwards, until every open card's comments are covered.
+
+    Cards, lists, members and comments are indexed on load, so nothing
+    built from a snapshot needs further network access to read.
+    """
+    BOARD_QUERY = {
+        'fields': 'id,name,url',
+        'lists': 'open',
+        'cards': 'open',
+        'card_attachments': 'true',
+        'members': 'all',
+        'actions': 'commentCard',
+        # Maximum allowed by Trello for nested actions, newest first.
+        'actions_limit': 1000,
+    }
+    ACTIONS_PAGE_SIZE = 1000
+
+    def __init__(self, board_json, client=None):
+        self.client = client
+        self.id = board_json['id']
+        self.name = board_json['name']
+
+        self.lists = [SnapshotList(self, l) for l in board_json.get('lists', [])]
+        self.lists_by_id = {l.id: l for l in self.lists}
+
+        self.members_by_id = {}
+        for m in board_json.get('members', []):
+            self.members_by_id[m['id']] = Member(m['id'], m['username'], m.get('fullName', ''))
+
+        self.comments_by_card = collections.defaultdict(list)
+        for a in board_json.get('actions', []):
+            if a['type'] == 'commentCard':
+                self.comments_by_card[a['data']['card']['id']].append(a)
+
+        self.cards_by_id = {}
+        self.cards_by_list = collections.defaultdict(list)
+        for c in sorted(board_json.get('cards', []), key=lambda c: c['pos']):
+            # Board exports include archived cards, which the API query leaves out.
+            if c.get('closed'):
+                continue
+            card = SnapshotCard(self, c)
+            self.cards_by_id[card.id] = card
+            self.cards_by_list[card.list_id].append(card)
+
+    @classmethod
+    def from_client(cls, client, board_id):
+        # Copied, since py-trello adds the API key and token to query params.
+        board_json = client.fetch_json('/boards/' + board_id, query_params=dict(cls.BOARD_QUERY))
+        board_json['actions'] = cls.fetch_older_comments(client, board_id, board_json)
+        return cls(board_json, client=client)
+
+    @classmethod
+    def fetch_older_comments(cls, client, board_id, board_json):
+        """Return the board's comments, paging back past the bulk request's limit.
+
+        Paging stops once comments are older than every open card, since
+        no card has comments from before it was created.
+        """
+        actions = list(board_json.get('actions', []))
+        cards = board_json.get('cards', [])
+        if not cards:
+            return actions
+        oldest_card = min(id_timestamp(c['id']) for c in cards)
+
+        page = actions
+        while len(page) >= cls.ACTIONS_PAGE_SIZE and id_timestamp(actions[-1]['id']) > oldest_card:
+            page = client.fetch_json('/boards/' + board_id + '/actions', query_params={
+                'filter': 'commentCard',
+                'limit': cls.ACTIONS_PAGE_SIZE,
+                'before': actions[-1]['id'],
+            })
+            actions.extend(page)
+        return actions
+
+    @classmethod
+    def from_file(cls, path):
+        # Board exports from Trello (eg. data/trello-projects/) have the same shape.
+        with open(path) as f:
+            board_json = json.load(f)
+        return cls(board_json)
+
+    def get_lists(self, list_filter='open'):
+        if list_filter == 'open':
+            return [l for l in self.lists if not l.closed]
+        return list(self.lists)
+
+    def get_card(self, card_id):
+        return self.cards_by_id[card_id]
+
+    def get_member(self, member_id):
+        # Cards can keep members who have since left the board, so fetch
+        # those once and remember them alongside the rest.
+        if member_id not in self.members_by_id and self.client:
+            m = self.client.fetch_json('/members/' + member_id, query_params={'fields': 'username,fullName'})
+            self.members_by_id[member_id] = Member(m['id'], m['username'], m.get('fullName', ''))
+
+        return self.members_by_id[member_id]
+
+def load_board(client, board_id, snapshot=None):
+    """Load a board from a local snapshot file if provided, otherwise from Trello."""
+    if snapshot:
+        return BoardSnapshot.from_file(snapshot)
+
+    return BoardSnapshot.from_client(client, board_id)
@@ -1,33 +1,16 @@
 import click
-import csv
 from html.parser import HTMLParser
-import json
 import pprint
-import re
 import requests
 import textwrap
-import urllib
 
 from commands.common import common_params
-from commands.utils.rebrandly import Rebrandly, AmbiguousCustomDomainError, NoCustomDomainsExistError
+from commands.utils import httpclient
+from commands.utils.batch import run_batch
+from commands.utils.rebrandly import Rebrandly, AmbiguousCustomDomainError, NoCustomDomainsExistError, RequestError
+from commands.utils.sheet_source import SheetFetchError, SheetSource
 
 CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
-GSHEET_URL_RE = re.compile('https://docs.google.com/spreadsheets/d/([\w_-]+)/(?:edit|view)(?:#gid=([0-9]+))?')
-
-def parse_gsheet_url(url):
-    matches = GSHEET_URL_RE.match(url)
-
-    # Raise error if key not parseable.
-    spreadsheet_key = matches.group(1)
-    if spreadsheet_key == None:
-        raise 'Could not parse key from spreadsheet url'
-
-    # Assume first worksheet if not specified.
-    worksheet_id = matches.group(2)
-    if worksheet_id == None:
-        worksheet_id = 0
-
-    return spreadsheet_key, worksheet_id
 
 def lookup_link(links=[], slashtag=''):
     matched_link = [l for l in links if l['slashtag'] == slashtag]
@@ -36,6 +19,22 @@ def lookup_link(links=[], slashtag=''):
     else:
         return None
 
+def fetch_title(url):
+    # Sometimes requests gets blocked
+    try:
+        r = httpclient.get(url, allow_redirects=True)
+        if 'text/html' in r.headers['Content-Type']:
+            # Extract page title after redirects.
+            parser = TitleParser()
+            # FIXME: Title parser. Not working.
+            title = parser.feed(r.content.decode('utf-8'))
+        else:
+            title = 'File: '+r.headers['Content-Type']
+    except (requests.ConnectionError, requests.Timeout):
+        title = ''
+
+    return title
+
 # See: https://stackoverflow.com/a/36650753/504018
 class TitleParser(HTMLParser):
     # Customized: self.found_once ensures we only grab the first tag, as some
@@ -101,25 +100,18 @@ def gsheet2rebrandly(rebrandly_api_key, gsheet, domain_name, yes, verbose, debug
 
     ### Fetch spreadsheet
 
-    spreadsheet_key, worksheet_id = parse_gsheet_url(gsheet)
-    CSV_URL_TEMPLATE = 'https://docs.google.com/spreadsheets/d/{key}/export?format=csv&id={key}&gid={id}'
-    csv_url = CSV_URL_TEMPLATE.format(key=spreadsheet_key, id=worksheet_id)
     # Fetch and parse shortlink CSV.
-    r = requests.get(csv_url)
-    if r.status_code != requests.codes.ok:
+    sheet = SheetSource(gsheet)
+    try:
+        sheet.fetch()
+    except SheetFetchError:
         raise click.Abort()
-    csv_content = r.content.decode('utf-8')
-    csv_content = csv_content.split('\r\n')
 
     ### Confirm spreadsheet title
 
-    cd_header = r.headers.get('Content-Disposition')
-    # See: https://tools.ietf.org/html/rfc5987#section-3.2.1 (ext-value definition)
-    m = re.search("filename\*=(?P<charset>.+)'(?P<language>.*)'(?P<filename>.+)", cd_header)
-    filename = m.group('filename')
-    filename = urllib.parse.unquote(filename)
-    # Remove csv filename suffix.
-    filename = filename[:-len('.csv')]
+    filename = sheet.title
+    # Read rows now, rather than holding the download open during prompts.
+    rows = list(sheet.rows())
 
     ### Confirm domain
 
@@ -171,9 +163,12 @@ def gsheet2rebrandly(rebrandly_api_key, gsheet, domain_name, yes, verbose, debug
         last_links = this_links
         first = False
 
+    # Fetch all destination page titles at once, rather than one per row.
+    destination_urls = sorted(set(row['destination_url'] for row in rows if row['destination_url']))
+    titles = dict(zip(destination_urls, run_batch(fetch_title, destination_urls)))
+
     # Iterate through CSV content and perform actions on data
-    reader = csv.DictReader(csv_content, delimiter=',')
-    for row in reader:
+    for row in rows:
         link = lookup_link(all_links, row['slashtag'])
         if debug: click.echo(link, err=True)
 
@@ -184,25 +179,16 @@ def gsheet2rebrandly(rebrandly_api_key, gsheet, domain_name, yes, verbose, debug
                 continue
 
             # NOTE: Not possible to "trash", only to fully delete, as per support chat question.
-            r = requests.delete('https://api.rebrandly.com/v1/links/'+link['id'],
-                                headers={'apikey': rebrandly_api_key})
+            try:
+                r = rebrandly.delete('/links/'+link['id'])
+            except RequestError as e:
+                click.echo(e, err=True)
+                raise click.Abort()
             if debug: click.echo(pprint.pformat(r))
             click.echo('Deleted shortlink: '+row['slashtag'])
             continue
 
-
-        # Sometimes requests gets blocked
-        try:
-            r = requests.get(row['destination_url'], allow_redirects=True)
-            if 'text/html' in r.headers['Content-Type']:
-                # Extract page title after redirects.
-                parser = TitleParser()
-                # FIXME: Title parser. Not working.
-                title = parser.feed(r.content.decode('utf-8'))
-            else:
-                title = 'File: '+r.headers['Content-Type']
-        except requests.ConnectionError:
-            title = ''
+        title = titles[row['destination_url']]
 
         payload = {
             'slashtag': row['slashtag'],
@@ -217,16 +203,12 @@ def gsheet2rebrandly(rebrandly_api_key, gsheet, domain_name, yes, verbose, debug
             if noop:
                 pass
             else:
-                r = requests.post('https://api.rebrandly.com/v1/links/'+link['id'],
-                                  data=json.dumps(payload),
-                                  headers={
-                                      'apikey': rebrandly_api_key,
-                                      'Content-Type': 'application/json',
-                                  })
-                if debug: click.echo('>>> ' + pprint.pformat(r.json()))
-                if r.status_code != requests.codes.ok:
-                    click.echo(pprint.pformat(r.__dict__))
+                try:
+                    r = rebrandly.post('/links/'+link['id'], payload)
+                except RequestError as e:
+                    click.echo(e, err=True)
                     raise click.Abort()
+                if debug: click.echo('>>> ' + pprint.pformat(r.json()))
             click.echo('Updated shortlink: '+row['slashtag'])
         else:
             if noop:
@@ -234,16 +216,12 @@ def gsheet2rebrandly(rebrandly_api_key, gsheet, domain_name, yes, verbose, debug
             else:
                 payload['domain'] = {'fullName': domain_name}
                 payload['slashtag'] = row['slashtag']
-                r = requests.post('https://api.rebrandly.com/v1/links',
-                                  data=json.dumps(payload),
-                                  headers={
-                                      'apikey': rebrandly_api_key,
-                                      'Content-Type': 'application/json',
-                                  })
-                if debug: click.echo('>>> ' + pprint.pformat(r.json()))
-                if r.status_code != requests.codes.ok:
-                    click.echo(pprint.pformat(r))
+                try:
+                    r = rebrandly.post('/links', payload)
+                except RequestError as e:
+                    click.echo(e, err=True)
                     raise click.Abort()
+                if debug: click.echo('>>> ' + pprint.pformat(r.json()))
             click.echo('Created shortlink: '+row['slashtag'])
 
     if noop: click.echo('Command exited no-op mode without creating/updating any data.')
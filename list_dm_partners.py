@@ -1,5 +1,7 @@
 import click
 
+from commands.utils import metrics
+from commands.utils.batch import run_batch
 from commands.utils.slackclient import CustomSlackClient
 
 
@@ -21,36 +23,34 @@ def list_dm_contacts(slack_token):
 
             * This list of usernames can be copied into new messages and modified to suit needs.
     """
+    metrics.instrument_script('list_dm_partners')
 
     sc = CustomSlackClient(slack_token)
-    res = sc.api_call('conversations.list',
-        limit=100,
-        types='im,mpim',
-    )
-
-    channels = res['channels']
-
     token_meta = sc.api_call('auth.test')
+    self_id = token_meta['user_id']
 
-    res = sc.api_call('im.list')
-    ims = res['ims']
-    self_im = [c for c in ims if c['user'] == token_meta['user_id']].pop()
+    channels = sc.get_channels(types='im,mpim', exclude_archived=False)
+    self_im = [c for c in channels if c.get('user') == self_id].pop()
 
-    recent_contacts = []
+    # A DM's partner is already in its listing, so only group DMs need
+    # their members fetched.
+    mpims = [c for c in channels if c.get('is_mpim')]
+    mpim_members = dict(zip([c['id'] for c in mpims],
+                            run_batch(lambda c: sc.get_member_ids(c['id']), mpims)))
 
+    member_ids = []
+    seen_ids = set()
     for c in reversed(channels):
-        res = sc.api_call('conversations.members',
-                          limit=100,
-                          channel=c['id'],
-                          )
-        members = res['members']
+        if c.get('is_mpim'):
+            members = mpim_members[c['id']]
+        else:
+            members = [self_id, c['user']]
         for mid in members:
-            check_by_id = lambda id: any(c['id'] == id for c in recent_contacts)
-            if not check_by_id(mid):
-                res = sc.api_call('users.info', user=mid)
-                user = res['user']
-                if not user['is_bot']:
-                    recent_contacts.append(user)
+            if mid not in seen_ids:
+                seen_ids.add(mid)
+                member_ids.append(mid)
+
+    recent_contacts = [u for u in sc.get_users(member_ids) if not u['is_bot']]
 
     message = ''
     for u in recent_contacts:
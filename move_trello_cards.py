@@ -6,12 +6,16 @@ import logging
 import os
 import re
 import requests
+import time
 
 from datetime import datetime, timedelta
 from trello import TrelloClient
 
 from commands.common import common_params
-from commands.utils.trello import BreakoutGroup
+from commands.utils.batch import run_batch
+from commands.utils.pitch_dataset import get_pitch_history
+from commands.utils.ratelimit import get_service
+from commands.utils.trello import BreakoutGroup, load_board
 
 
 CARD_IGNORE_LIST = os.getenv('TRELLO_CARD_IGNORE_LIST').split(',')
@@ -48,19 +52,37 @@ CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
               help='If provided, card only moved if older than this. Default: 0',
               metavar='DAYS',
               )
+@click.option('--snapshot',
+              envvar='TRELLO_SNAPSHOT',
+              type=click.Path(exists=True, dir_okay=False),
+              help='Local Trello board export to read instead of the API. Requires --noop.',
+              metavar='<file>',
+              )
+@click.option('--workers', '-w',
+              default=8,
+              help='Number of cards to evaluate and move concurrently. Default: 8',
+              )
 @common_params
-def move_trello_cards(api_key, api_secret, from_list, to_list, board, older_than, yes, verbose, debug, noop):
+def move_trello_cards(api_key, api_secret, from_list, to_list, board, older_than, snapshot, workers, yes, verbose, debug, noop):
     if debug: click.echo('>>> Debug mode: enabled')
     if noop: click.echo('>>> No-op mode: enabled (No operations affecting data will be run)')
 
+    if snapshot and not noop:
+        raise click.UsageError('Cards cannot be moved on a board snapshot. Use --noop.')
+
     board_id = board
+    start_time = time.monotonic()
 
+    # All Trello calls share one token's quota, so pace them together.
+    trello_service = get_service('trello')
     client = TrelloClient(
         api_key=api_key,
         api_secret=api_secret,
+        http_service=trello_service,
     )
 
-    board = client.get_board(board_id)
+    # Cards, attachments and comments all come from one bulk board request.
+    board = load_board(client, board_id, snapshot=snapshot)
     board_lists = board.get_lists('open')
 
     def select_list(lists, filter_string):
@@ -76,17 +98,16 @@ def move_trello_cards(api_key, api_secret, from_list, to_list, board, older_than
     template = 'Moving cards from list "{}" to "{}"...'
     click.echo(template.format(from_list.name, to_list.name), err=True)
 
-    for c in cards:
-        if c.name in CARD_IGNORE_LIST:
-            continue
-
-        breakout = BreakoutGroup(c)
+    delta = timedelta(days=older_than)
+    now = datetime.now()
+    # Download pitch history once up front, rather than racing in workers.
+    history = get_pitch_history()
 
-        delta = timedelta(days=older_than)
-        now = datetime.now()
+    def process_card(c):
+        breakout = BreakoutGroup(c, history=history)
         if breakout.last_pitch_date+delta > now:
             # Skip cards that have been pitched within timeframe.
-            continue
+            return False
 
         if not noop:
             c.change_list(to_list.id)
@@ -97,6 +118,17 @@ def move_trello_cards(api_key, api_secret, from_list, to_list, board, older_than
         if debug:
             click.echo(vars(c), err=True)
 
+        return True
+
+    cards = [c for c in cards if c.name not in CARD_IGNORE_LIST]
+    # Trello calls are already paced by trello_service.
+    moved = run_batch(process_card, cards, concurrency=workers)
+
+    template = 'Moved {} of {} cards in {:.1f}s ({} Trello API calls, {} rate-limited)'
+    summary = template.format(sum(moved), len(cards), time.monotonic() - start_time,
+                              trello_service.calls, trello_service.throttled)
+    click.echo(summary, err=True)
+
     if noop: click.echo('Command exited no-op mode without creating/updating any data.')
 
 if __name__ == '__main__':
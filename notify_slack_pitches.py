@@ -6,12 +6,15 @@ import sys
 from jinja2 import Template
 from trello import TrelloClient
 
+from commands.utils import metrics
+from commands.utils.ratelimit import get_service
 from commands.utils.slackclient import CustomSlackClient
-from commands.utils.trello import BreakoutGroup
+from commands.utils.trello import BreakoutGroup, load_board
 
 dirname = os.path.dirname(__file__)
 filename = os.path.join(dirname, '.env')
 load_dotenv(dotenv_path=filename)
+metrics.instrument_script('notify_slack_pitches')
 
 def str2bool(v):
   return v.lower() in ("yes", "true", "t", "1")
@@ -19,16 +22,19 @@ def str2bool(v):
 DEBUG = str2bool(os.getenv('DEBUG', ''))
 SLACK_API_TOKEN = os.getenv('SLACK_API_TOKEN')
 SLACK_ANNOUNCE_CHANNEL = os.getenv('SLACK_ANNOUNCE_CHANNEL_PUB')
+# Optional path to a local board export, used instead of the Trello API.
+TRELLO_SNAPSHOT = os.getenv('TRELLO_SNAPSHOT')
 LIST_TONIGHT = "Tonight's Pitches"
 
 # No API key needed for read-only.
-client = TrelloClient(None)
+client = TrelloClient(None, http_service=get_service('trello'))
 
 board_url = 'https://trello.com/b/EVvNEGK5/hacknight-projects'
 m = re.search('^https://trello.com/b/(?P<board_id>.+?)(?:/.*)?$', board_url)
 board_id = m.group('board_id')
 
-board = client.get_board(board_id)
+# Cards, attachments and comments all come from one bulk board request.
+board = load_board(client, board_id, snapshot=TRELLO_SNAPSHOT)
 lists = board.get_lists('open')
 [pitch_list] = [l for l in lists if l.name == LIST_TONIGHT]
 cards = pitch_list.list_cards()
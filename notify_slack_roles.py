@@ -7,10 +7,13 @@ import pystache
 import re
 from slackclient import SlackClient
 
+from commands.utils import metrics
+
 
 dirname = os.path.dirname(__file__)
 filename = os.path.join(dirname, '.env')
 load_dotenv(dotenv_path=filename)
+metrics.instrument_script('notify_slack_roles')
 
 def str2bool(v):
   return v.lower() in ("yes", "true", "t", "1")
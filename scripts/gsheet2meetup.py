@@ -1,19 +1,25 @@
 import click
 from collections import defaultdict
-import csv
 import datetime
 import hashlib
 import meetup.api
+import os
 import pprint
 import pystache
 import random
 import re
-import requests
+import sys
 import tempfile
 import textwrap
 import time
 import urllib
 
+# Allow importing shared modules when run as `python scripts/gsheet2meetup.py`.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from commands.utils import httpclient, metrics
+from commands.utils.ratelimit import RateLimitedService, get_bucket
+from commands.utils.sheet_source import SheetFetchError, SheetSource
+
 
 CONTEXT_SETTINGS = dict(help_option_names=['--help', '-h'])
 GDOC_URL_RE = re.compile('https://docs.google.com/(?:spreadsheets|document)/d/([\w_-]+)/(?:edit|view)(?:#gid=([0-9]+))?')
@@ -137,6 +143,8 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
     To explicitly unset certain fields, set its value to one of: none, ---, --, -, na, n/a, tbd, tba
     """
 
+    metrics.instrument_script('gsheet2meetup')
+
     if debug: click.echo('>>> Debug mode: enabled')
 
     if noop: click.echo('>>> No-op mode: enabled (No operations affecting data will be run)')
@@ -144,25 +152,18 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
     ### Fetch spreadsheet
     if verbose: click.echo('Fetching event information...')
 
-    spreadsheet_key, worksheet_id = parse_gdoc_url(gsheet)
-    CSV_URL_TEMPLATE = 'https://docs.google.com/spreadsheets/d/{key}/export?format=csv&id={key}&gid={id}'
-    csv_url = CSV_URL_TEMPLATE.format(key=spreadsheet_key, id=worksheet_id)
-    # Fetch and parse shortlink CSV.
-    r = requests.get(csv_url)
-    if r.status_code != requests.codes.ok:
+    # Fetch and parse event CSV.
+    sheet = SheetSource(gsheet)
+    try:
+        sheet.fetch()
+    except SheetFetchError:
         raise click.Abort()
-    csv_content = r.content.decode('utf-8')
-    csv_content = csv_content.split('\r\n')
 
     ### Confirm spreadsheet title
 
-    cd_header = r.headers.get('Content-Disposition')
-    # See: https://tools.ietf.org/html/rfc5987#section-3.2.1 (ext-value definition)
-    m = re.search("filename\*=(?P<charset>.+)'(?P<language>.*)'(?P<filename>.+)", cd_header)
-    filename = m.group('filename')
-    filename = urllib.parse.unquote(filename)
-    # Remove csv filename suffix.
-    filename = filename[:-len('.csv')]
+    filename = sheet.title
+    # Read rows now, rather than holding the download open during prompts.
+    rows = list(sheet.rows())
 
     ### Output confirmation to user
 
@@ -181,6 +182,8 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
         click.confirm('Do you want to continue?', abort=True)
 
     mclient = meetup.api.Client(meetup_api_key)
+    # Pace calls to our rate limit, and retry them if throttled.
+    mclient.session = RateLimitedService(get_bucket('meetup'), http=mclient.session)
     response = mclient.GetEvents({
         'group_urlname': meetup_group_slug,
         'status': 'upcoming',
@@ -191,8 +194,7 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
     meetup_events = response.results
 
     # Iterate through CSV content and perform actions on data
-    reader = csv.DictReader(csv_content, delimiter=',')
-    for row in reader:
+    for row in rows:
         # Skip if date not set.
         if not row['date']:
             continue
@@ -281,13 +283,15 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
 
             # Set event description from template
             if row['template_url']:
-                template_url = add_cachebuster(row['template_url'])
+                template_url = row['template_url']
+                # Cache on the plain url, so CDN busting doesn't defeat our cache.
+                fetch_url = add_cachebuster(template_url)
                 url_data = alturlsplit(template_url)
                 if url_data.netloc == 'docs.google.com' and 'document' in url_data.path:
                     gdoc_key, _ = parse_gdoc_url(template_url)
                     TXT_URL_TEMPLATE = 'https://docs.google.com/document/d/{key}/export?format=txt'
-                    template_url = TXT_URL_TEMPLATE.format(key=gdoc_key)
-                r = requests.get(template_url)
+                    template_url = fetch_url = TXT_URL_TEMPLATE.format(key=gdoc_key)
+                r = httpclient.cached_get(fetch_url, cache_key=template_url)
                 # Get rid of byte order mark
                 # See: https://stackoverflow.com/a/8898439/504018
                 desc_tmpl = r.content.decode('utf-8-sig')
@@ -317,7 +321,7 @@ def gsheet2meetup(meetup_api_key, gsheet, meetup_group_slug, yes, verbose, debug
                 # To: https://drive.google.com/uc?id=1aVg0AODDtNl97Ntarm53KibO8oMOHVIw (image bytes)
                 # Download image from url.
                 _, image_path = tempfile.mkstemp()
-                r = requests.get(row['image_url'], allow_redirects=True)
+                r = httpclient.get(row['image_url'], allow_redirects=True)
                 f = open(image_path, 'wb')
                 f.write(r.content)
                 image_file = open(image_path, 'rb')
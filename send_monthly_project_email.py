@@ -29,6 +29,7 @@ import os
 import pystache
 import pytz
 
+from commands.utils import metrics
 from commands.utils.slackclient import CustomSlackClient
 
 
@@ -44,6 +45,8 @@ MAILCHIMP_SECTION_NAME = os.getenv('MAILCHIMP_SECTION_NAME')
 SLACK_API_TOKEN = os.getenv('SLACK_API_TOKEN')
 SLACK_ANNOUNCE_CHANNEL = os.getenv('SLACK_ANNOUNCE_CHANNEL_ORG')
 
+metrics.instrument_script('send_monthly_project_email')
+
 def get_project_data():
     projects = [
             {
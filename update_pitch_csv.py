@@ -3,6 +3,7 @@ import csv
 import datetime
 from dotenv import load_dotenv
 from github import Github
+from github.GithubException import UnknownObjectException
 from io import StringIO
 import json
 import os
@@ -11,9 +12,15 @@ import re
 import requests
 from trello import TrelloClient
 
+from commands.utils import metrics, pitch_dataset
+from commands.utils.pitch_dataset import fetch_dataset, git_blob_sha, replace_date_rows
+from commands.utils.ratelimit import get_service
+from commands.utils.trello import load_board
+
 dirname = os.path.dirname(__file__)
 filename = os.path.join(dirname, '.env')
 load_dotenv(dotenv_path=filename)
+metrics.instrument_script('update_pitch_csv')
 
 LOCAL_TZ = pytz.timezone('Canada/Eastern')
 
@@ -23,14 +30,23 @@ def str2bool(v):
 DEBUG = str2bool(os.getenv('DEBUG', ''))
 GITHUB_TOKEN = os.getenv('GH_PERSONAL_ACCESS_TOKEN')
 LIST_TONIGHT = "Tonight's Pitches"
+# Optional path to a local board export, used instead of the Trello API.
+TRELLO_SNAPSHOT = os.getenv('TRELLO_SNAPSHOT')
+# Either "full" to rewrite the whole dataset, or "delta" to only replace
+# rows for the target hacknight date.
+PITCH_CSV_MODE = os.getenv('PITCH_CSV_MODE', 'full')
+# Either "flat" for the single CSV, or "partitioned" for yearly CSVs and a manifest.
+PITCH_DATASET_LAYOUT = pitch_dataset.dataset_layout()
 
-client = TrelloClient(None)
+client = TrelloClient(None, http_service=get_service('trello'))
 
 board_url = 'https://trello.com/b/EVvNEGK5/hacknight-projects'
 m = re.search('^https://trello.com/b/(?P<board_id>.+?)(?:/.*)?$', board_url)
 board_id = m.group('board_id')
 
-board = client.get_board(board_id)
+# Lists, cards and all board members come from one bulk board request, and
+# assignees are then looked up from its member index.
+board = load_board(client, board_id, snapshot=TRELLO_SNAPSHOT)
 lists = board.get_lists('open')
 [pitch_list] = [l for l in lists if l.name == LIST_TONIGHT]
 cards = pitch_list.list_cards()
@@ -50,32 +66,14 @@ def last_hacknight(date):
     return last_hacknight
 
 
-PITCH_CSV_URL = 'https://raw.githubusercontent.com/CivicTechTO/dataset-civictechto-breakout-groups/master/data/civictechto-breakout-groups.csv'
-r = requests.get(PITCH_CSV_URL)
-pitch_csv_content = r.text
-
-with requests.Session() as s:
-    download = s.get(PITCH_CSV_URL)
-    decoded_content = download.content.decode('utf-8')
-    reader = csv.DictReader(decoded_content.splitlines(), delimiter=',')
-
-csvfile = StringIO()
-writer = csv.DictWriter(csvfile, fieldnames=reader.fieldnames)
-writer.writeheader()
-
 hacknight_date = last_hacknight(datetime.datetime.now(pytz.utc))
+hacknight_date_str = hacknight_date.strftime('%Y-%m-%d')
 
-for row in reader:
-    # If entries for this date already exist, ignore them and rewrite.
-    if row['date'] == hacknight_date.strftime('%Y-%m-%d'):
-        continue
-    writer.writerow(row)
-
-
+new_rows = []
 for card in cards:
-    assigned_members = [client.get_member(member_id) for member_id in card.member_ids]
+    assigned_members = [board.get_member(member_id) for member_id in card.member_ids]
     data = {
-            'date':    hacknight_date.strftime('%Y-%m-%d'),
+            'date':    hacknight_date_str,
             'project': card.name,
             'person':  '',
             'trello_card_id': card.id,
@@ -84,17 +82,80 @@ for card in cards:
     if assigned_members:
         data.update({'person': assigned_members[0].username})
 
-    writer.writerow(data)
+    new_rows.append(data)
+
+# Output files, keyed by their path in the dataset repo.
+dataset_files = {}
+
+if PITCH_DATASET_LAYOUT == 'partitioned':
+    # Only the current year's partition and the manifest are read or written.
+    partitions = None
+    try:
+        manifest = pitch_dataset.fetch_manifest()
+    except requests.HTTPError as e:
+        if e.response.status_code != 404:
+            raise
+        # Bootstrap partitions from the flat file on first run.
+        reader = csv.DictReader(fetch_dataset().splitlines(), delimiter=',')
+        manifest, partitions = pitch_dataset.build_manifest(reader, reader.fieldnames)
+        for year, rows in partitions.items():
+            dataset_files[pitch_dataset.partition_path(year)] = pitch_dataset.write_csv(manifest['fieldnames'], rows)
+
+    year = hacknight_date_str[:4]
+    if partitions is None:
+        year_rows = pitch_dataset.fetch_partition(year)
+    else:
+        # Just bootstrapped, so nothing is committed to fetch yet.
+        year_rows = partitions.get(year, [])
+    rows = [r for r in year_rows if r['date'] != hacknight_date_str]
+    rows += new_rows
+    manifest = pitch_dataset.update_manifest(manifest, year, rows)
+    dataset_files[pitch_dataset.partition_path(year)] = pitch_dataset.write_csv(manifest['fieldnames'], rows)
+    dataset_files[pitch_dataset.MANIFEST_PATH] = json.dumps(manifest, indent=2, sort_keys=True) + '\n'
+elif PITCH_CSV_MODE == 'delta':
+    # Only touch the rows for this hacknight, leaving the rest byte-for-byte.
+    dataset_files[pitch_dataset.DATASET_PATH] = replace_date_rows(fetch_dataset(), hacknight_date_str, new_rows)
+else:
+    reader = csv.DictReader(fetch_dataset().splitlines(), delimiter=',')
+
+    csvfile = StringIO()
+    writer = csv.DictWriter(csvfile, fieldnames=reader.fieldnames)
+    writer.writeheader()
+
+    for row in reader:
+        # If entries for this date already exist, ignore them and rewrite.
+        if row['date'] == hacknight_date_str:
+            continue
+        writer.writerow(row)
+
+    writer.writerows(new_rows)
+    dataset_files[pitch_dataset.DATASET_PATH] = csvfile.getvalue()
 
 if DEBUG:
-    with open('projects.csv', 'w') as f:
-        f.write(csvfile.getvalue())
+    for path, file_content in dataset_files.items():
+        # Flat dataset keeps its historical local name.
+        local_path = 'projects.csv' if path == pitch_dataset.DATASET_PATH else os.path.basename(path)
+        with open(local_path, 'w') as f:
+            f.write(file_content)
 else:
     g = Github(GITHUB_TOKEN)
-    path = 'data/civictechto-breakout-groups.csv'
-
-    existing_csv_file = g.get_user('civictechto').get_repo('dataset-civictechto-breakout-groups').get_file_contents(path)
-    sha = existing_csv_file.sha
-    message = 'Updated data for {} hacknight.'.format(hacknight_date.strftime('%Y-%m-%d'))
-    content = csvfile.getvalue().encode('utf-8')
-    g.get_user('civictechto').get_repo('dataset-civictechto-breakout-groups').update_file(path, message, content, sha)
+    repo = g.get_user('civictechto').get_repo('dataset-civictechto-breakout-groups')
+    message = 'Updated data for {} hacknight.'.format(hacknight_date_str)
+
+    # The manifest goes last. If a run fails partway, the next one then
+    # finds no manifest and bootstraps again, rather than trusting it
+    # with partitions that were never committed.
+    commit_order = lambda item: (item[0] == pitch_dataset.MANIFEST_PATH, item[0])
+    for path, file_content in sorted(dataset_files.items(), key=commit_order):
+        content = file_content.encode('utf-8')
+        try:
+            existing_csv_file = repo.get_file_contents(path)
+        except UnknownObjectException:
+            repo.create_file(path, message, content)
+            continue
+
+        # The file sha is the git blob hash, so an identical file needs no commit.
+        if existing_csv_file.sha == git_blob_sha(content):
+            print('No changes to {} for {} hacknight. Skipping commit.'.format(path, hacknight_date_str))
+        else:
+            repo.update_file(path, message, content, existing_csv_file.sha)